@@ -0,0 +1,14 @@
+'''
+KaiTorch benchmarks
+
+    python -m benchmarks [--quick] [--only NAME ...] [--out results.json]
+
+Micro benchmarks time the engine's building blocks (Scalar ops, backward over
+deep and wide graphs, Dense layers, optimizer steps), macro benchmarks time
+Sequential.fit and Sequential.predict on synthetic regression and
+classification sets. Every result reports samples/sec and peak memory and the
+whole run is written as JSON, so runs from different releases can be diffed.
+'''
+from benchmarks.harness import measure, run_all
+
+__all__ = ['measure', 'run_all']
@@ -0,0 +1,21 @@
+import argparse
+
+from benchmarks.harness import run_all, write
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run the KaiTorch benchmarks')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast sanity check')
+    parser.add_argument('--only', nargs='*', metavar='NAME', help='only run benchmarks whose name starts with NAME')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best is kept')
+    parser.add_argument('--out', default='benchmark_results.json', help='where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    report = run_all(quick=args.quick, only=args.only, repeat=args.repeat)
+    write(report, args.out)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Timing and memory harness shared by the micro and macro benchmarks
+
+A benchmark is a function taking a size preset and returning (setup, fn,
+n_samples): setup() builds fresh inputs, fn(inputs) does the timed work on
+them and n_samples is how many samples (ops, nodes, records, ...) one call to
+fn processes.
+'''
+import datetime
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+__all__ = ['measure', 'run_all', 'BENCHMARKS', 'benchmark']
+
+# benchmark name -> function, in registration order
+BENCHMARKS = {}
+
+
+def benchmark(name):
+
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+def measure(setup, fn, n_samples, repeat=3):
+
+    # best of repeat timed runs, tracemalloc slows every allocation down so
+    # the peak is taken from one extra untimed run
+    times = []
+    for _ in range(repeat):
+        inputs = setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn(inputs)
+        times.append(time.perf_counter() - start)
+
+    inputs = setup()
+    gc.collect()
+    tracemalloc.start()
+    fn(inputs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        'samples': n_samples,
+        'seconds': best,
+        'samples_per_sec': n_samples / best,
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_all(quick=False, only=None, repeat=3):
+
+    # importing the suites registers their benchmarks
+    from benchmarks import micro, macro  # noqa: F401
+
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        setup, fn, n_samples = bench(quick)
+        results[name] = measure(setup, fn, n_samples, repeat=repeat)
+        print(f'{name:<40}{results[name]["samples_per_sec"]:>16,.0f} samples/s'
+              f'{results[name]["peak_memory_bytes"] / 2**20:>10.1f} MiB', file=sys.stderr)
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'quick': quick,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def write(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,90 @@
+'''
+Macro benchmarks: Sequential.fit and Sequential.predict on synthetic
+regression and classification sets
+'''
+import math
+import random
+
+import kaitorch.losses  # noqa: F401
+from kaitorch.layers import Dense
+from kaitorch.models import Sequential
+
+from benchmarks.harness import benchmark
+
+N_FEATURES = 8
+
+
+def regression(n_records, seed=0):
+    rng = random.Random(seed)
+    x = [[rng.uniform(-1, 1) for _ in range(N_FEATURES)] for _ in range(n_records)]
+    y = [math.sin(3 * r[0]) + r[1] * r[2] for r in x]
+    return x, y
+
+
+def classification(n_records, n_classes=3, seed=0):
+    rng = random.Random(seed)
+    centers = [[rng.gauss(0, 1) for _ in range(N_FEATURES)] for _ in range(n_classes)]
+    x, y = [], []
+    for _ in range(n_records):
+        label = rng.randrange(n_classes)
+        x.append([c + rng.gauss(0, 0.5) for c in centers[label]])
+        y.append([1 if k == label else 0 for k in range(n_classes)])
+    return x, y
+
+
+TASKS = {
+    'regression': (regression, 1, None, 'mse'),
+    'classification': (classification, 3, 'softmax', 'categorical_crossentropy'),
+}
+
+
+def model(task, jit=False, seed=0):
+    _, nouts, activation, loss = TASKS[task]
+    random.seed(seed)
+    m = Sequential()
+    m.add(Dense(16, activation='tanh'))
+    m.add(Dense(16, activation='tanh'))
+    m.add(Dense(nouts, activation=activation))
+    m.compile('Adam', loss, jit=jit)
+    m.build(N_FEATURES)
+    return m
+
+
+def _fit_benchmark(task, jit):
+
+    def bench(quick):
+        n_records, epochs = (256, 1) if quick else (2048, 2)
+        x, y = TASKS[task][0](n_records)
+
+        def setup():
+            return model(task, jit=jit)
+
+        def fn(m):
+            m.fit(x, y, epochs=epochs, batch_size=32, shuffle=False)
+
+        return setup, fn, n_records * epochs
+
+    return bench
+
+
+def _predict_benchmark(task):
+
+    def bench(quick):
+        n_records = 1024 if quick else 16384
+        x, _ = TASKS[task][0](n_records)
+
+        def setup():
+            return model(task)
+
+        def fn(m):
+            m.predict(x)
+
+        return setup, fn, n_records
+
+    return bench
+
+
+for _task in TASKS:
+    benchmark(f'macro/fit/{_task}')(_fit_benchmark(_task, jit=False))
+    benchmark(f'macro/fit_jit/{_task}')(_fit_benchmark(_task, jit=True))
+    benchmark(f'macro/predict/{_task}')(_predict_benchmark(_task))
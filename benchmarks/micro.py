@@ -0,0 +1,157 @@
+'''
+Micro benchmarks: Scalar op throughput, backward time against graph depth and
+width, Dense forward passes, forward-mode jvp and optimizer steps
+'''
+import random
+
+from kaitorch import optimizers
+from kaitorch.core import Scalar
+from kaitorch.layers import Dense
+from kaitorch.models import Sequential
+
+from benchmarks.harness import benchmark
+
+OPS = {
+    '+': lambda a, b: a + b,
+    '*': lambda a, b: a * b,
+    '**': lambda a, b: a ** 2,
+    'exp': lambda a, b: a.exp(),
+    'ln': lambda a, b: a.log(),
+    'tanh': lambda a, b: a.activation('tanh'),
+}
+
+
+def _leaves(n):
+    return [Scalar(random.uniform(0.1, 1.0)) for _ in range(n)]
+
+
+def _op_benchmark(op):
+
+    def bench(quick):
+        n = 20_000 if quick else 200_000
+
+        def setup():
+            return _leaves(n), Scalar(0.5)
+
+        # outputs are kept, so the peak includes the nodes they hold
+        def fn(inputs):
+            xs, b = inputs
+            return [OPS[op](x, b) for x in xs]
+
+        return setup, fn, n
+
+    return bench
+
+
+for _op in OPS:
+    benchmark(f'micro/op/{_op}')(_op_benchmark(_op))
+
+
+def _depth_benchmark(depth):
+
+    def bench(quick):
+        d = depth // 10 if quick else depth
+
+        # x' = tanh(x * w + c), three nodes per level
+        def setup():
+            x = Scalar(0.5)
+            for w in _leaves(d):
+                x = (x * w + 0.1).activation('tanh')
+            return x
+
+        def fn(root):
+            root.backward()
+
+        return setup, fn, 3 * d
+
+    return bench
+
+
+for _depth in (1_000, 10_000, 100_000):
+    benchmark(f'micro/backward/depth_{_depth}')(_depth_benchmark(_depth))
+
+
+def _width_benchmark(width):
+
+    def bench(quick):
+        w = width // 10 if quick else width
+
+        # w parallel branches tanh(x_i * w_i) joined by a single affine node
+        def setup():
+            branches = [(x * v).activation('tanh') for x, v in zip(_leaves(w), _leaves(w))]
+            return Scalar.affine(branches, [1.0] * w, Scalar(0.0))
+
+        def fn(root):
+            root.backward()
+
+        return setup, fn, 2 * w + 1
+
+    return bench
+
+
+for _width in (1_000, 10_000, 100_000):
+    benchmark(f'micro/backward/width_{_width}')(_width_benchmark(_width))
+
+
+@benchmark('micro/dense/forward')
+def dense_forward(quick):
+    n_records = 20 if quick else 200
+
+    def setup():
+        layer = Dense(64, activation='ReLU')
+        layer.__build__(64)
+        return layer, [[random.random() for _ in range(64)] for _ in range(n_records)]
+
+    def fn(inputs):
+        layer, x = inputs
+        for record in x:
+            layer(record)
+
+    return setup, fn, n_records
+
+
+@benchmark('micro/dense/jvp')
+def dense_jvp(quick):
+    n_records = 20 if quick else 200
+
+    # a 1-unit hidden layer and a single output, so every layer hands a lone
+    # Dual (not a list) to the next one
+    def setup():
+        model = Sequential([Dense(64, activation='tanh'), Dense(1, activation='tanh'), Dense(1)])
+        model.build(64)
+        x = [[random.random() for _ in range(64)] for _ in range(n_records)]
+        return model, x, [random.random() for _ in range(64)]
+
+    def fn(inputs):
+        model, x, v = inputs
+        for record in x:
+            model.jvp(record, v)
+
+    return setup, fn, n_records
+
+
+def _optimizer_benchmark(name):
+
+    def bench(quick):
+        n_params, n_steps = (10_000, 10) if quick else (100_000, 20)
+
+        def setup():
+            params = _leaves(n_params)
+            for p in params:
+                p.grad = random.uniform(-1, 1)
+            optimizer = getattr(optimizers, name)()
+            optimizer.register(params)
+            return optimizer
+
+        def fn(optimizer):
+            for _ in range(n_steps):
+                optimizer.step()
+
+        # parameter updates
+        return setup, fn, n_params * n_steps
+
+    return bench
+
+
+for _name in optimizers.__all__:
+    benchmark(f'micro/optimizer/{_name}')(_optimizer_benchmark(_name))
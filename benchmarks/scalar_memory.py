@@ -0,0 +1,92 @@
+'''
+Per-node memory and allocation time of kaitorch.core.Scalar
+
+Builds the same chain of multiply/add nodes with the current Scalar and with
+LegacyScalar, a copy of the old layout (per-node __dict__, a set of parents,
+an op string and a freshly allocated _backward closure), then reports bytes
+and microseconds per node for each.
+
+    python -m benchmarks.scalar_memory [n_nodes]
+'''
+import sys
+import time
+import tracemalloc
+
+from kaitorch.core import Scalar
+
+
+class LegacyScalar:
+
+    def __init__(self, data, _in=(), _op=''):
+        self.data = data
+        self.grad = 0.0
+
+        self._backward = lambda: None
+        self._prev = set(_in)
+        self._op = _op
+
+    def __add__(a, b):
+        b = b if isinstance(b, LegacyScalar) else LegacyScalar(b)
+        y = LegacyScalar(a.data + b.data, (a, b), '+')
+
+        def _backward():
+            a.grad += y.grad
+            b.grad += y.grad
+
+        y._backward = _backward
+        return y
+
+    def __mul__(a, b):
+        b = b if isinstance(b, LegacyScalar) else LegacyScalar(b)
+        y = LegacyScalar(a.data * b.data, (a, b), '*')
+
+        def _backward():
+            a.grad += y.grad * b.data
+            b.grad += y.grad * a.data
+
+        y._backward = _backward
+        return y
+
+
+def build_chain(cls, n_nodes):
+    # every step creates a constant leaf and an op node, n_nodes in total
+    x = cls(1.0)
+    for i in range(n_nodes // 4):
+        x = x * 1.000001
+        x = x + 0.000001
+    return x
+
+
+def measure(cls, n_nodes):
+
+    # timed separately, tracemalloc slows every allocation down
+    start = time.perf_counter()
+    root = build_chain(cls, n_nodes)
+    elapsed = time.perf_counter() - start
+    del root
+
+    tracemalloc.start()
+    root = build_chain(cls, n_nodes)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del root
+
+    return allocated / n_nodes, elapsed / n_nodes * 1e6
+
+
+def main(n_nodes=1_000_000):
+
+    results = {cls.__name__: measure(cls, n_nodes) for cls in (LegacyScalar, Scalar)}
+
+    print(f'{"layout":<14}{"bytes/node":>12}{"µs/node":>10}')
+    for name, (nbytes, usec) in results.items():
+        print(f'{name:<14}{nbytes:>12.1f}{usec:>10.3f}')
+
+    (old_bytes, old_usec), (new_bytes, new_usec) = results.values()
+    print(f'memory: {old_bytes / new_bytes:.1f}x smaller, time: {old_usec / new_usec:.1f}x faster')
+
+    return results
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
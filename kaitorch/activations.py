@@ -1,13 +1,53 @@
 __all__ = ['sigmoid', 'tanh', 'ReLU', 'LeakyReLU', 'ELU', 'swish', 'softmax']
 
+import math
 import warnings
 
 import kaitorch.functional as F
-from kaitorch.core import Scalar
+from kaitorch.core import BACKWARD, Dual, Scalar, Tensor
+
+
+def get(activation):
+
+    if isinstance(activation, str) and activation in __all__:
+        return globals()[activation]()
+
+    elif isinstance(activation, Activation):
+        return activation
+
+    else:
+        raise Exception(f'Activation {activation} not in {__all__}')
 
 
 class Activation:
-    pass
+
+    def __init_subclass__(cls, **kwargs):
+        # each activation is its own op code, dispatching to its static _backward
+        super().__init_subclass__(**kwargs)
+        if '_backward' in vars(cls):
+            BACKWARD[cls.__name__] = cls._backward
+
+    def _dual(self, x):
+        # forward mode: the tangent is scaled by the same derivative backward uses
+        y = self.forward(x.data)
+        return Dual(y, self.derivative(x.data, y) * x.tangent)
+
+    def _tensor(self, tensor):
+
+        # Calculation: y = f(x), elementwise over the whole array
+        def _forward():
+            y = self.forward(tensor.data)
+            return Tensor(y, (tensor, ), type(self).__name__)
+
+        out = _forward()
+
+        # Chain Rule: dL/dx = dL/dy * f'(x)
+        def _backward():
+            tensor.grad += self.derivative(tensor.data, out.data) * out.grad
+
+        out._backward = _backward
+
+        return out
 
 
 class sigmoid(Activation):
@@ -18,20 +58,26 @@ class sigmoid(Activation):
     def __repr__(self):
         return 'sigmoid'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.sigmoid(x)
 
-        def _forward():
-            y = F.sigmoid(scalar.data)
-            return Scalar(y, (scalar, ), 'sigmoid')
+    def derivative(self, x, y):
+        return F.d_sigmoid(x, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_sigmoid(out.data) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.sigmoid(scalar.data)
+        return Scalar(y, (scalar, ), 'sigmoid')
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_sigmoid(scalar.data, y=out.data) * out.grad
 
 
 class tanh(Activation):
@@ -42,20 +88,26 @@ class tanh(Activation):
     def __repr__(self):
         return 'tanh'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.tanh(x)
 
-        def _forward():
-            y = F.tanh(scalar.data)
-            return Scalar(y, (scalar, ), 'tanh')
+    def derivative(self, x, y):
+        return F.d_tanh(x, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_tanh(out.data) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.tanh(scalar.data)
+        return Scalar(y, (scalar, ), 'tanh')
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_tanh(scalar.data, y=out.data) * out.grad
 
 
 class swish(Activation):
@@ -70,20 +122,26 @@ class swish(Activation):
     def __repr__(self):
         return f'swish(β={self.beta})'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.swish(x, self.beta)
 
-        def _forward():
-            y = F.swish(scalar.data, self.beta)
-            return Scalar(y, (scalar, ), 'swish')
+    def derivative(self, x, y):
+        return F.d_swish(x, self.beta, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_swish(out.data, self.beta) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.swish(scalar.data, self.beta)
+        return Scalar(y, (scalar, ), 'swish', self.beta)
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_swish(scalar.data, out._arg, y=out.data) * out.grad
 
 
 class ReLU(Activation):
@@ -94,20 +152,26 @@ class ReLU(Activation):
     def __repr__(self):
         return 'ReLU'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.ReLU(x)
 
-        def _forward():
-            y = F.ReLU(scalar.data)
-            return Scalar(y, (scalar, ), 'ReLU')
+    def derivative(self, x, y):
+        return F.d_ReLU(x, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_ReLU(out.data) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.ReLU(scalar.data)
+        return Scalar(y, (scalar, ), 'ReLU')
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_ReLU(scalar.data, y=out.data) * out.grad
 
 
 class LeakyReLU(Activation):
@@ -122,20 +186,26 @@ class LeakyReLU(Activation):
     def __repr__(self):
         return f'LeakyReLU(α={self.alpha})'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.LeakyReLU(x, self.alpha)
 
-        def _forward():
-            y = F.LeakyReLU(scalar.data, self.alpha)
-            return Scalar(y, (scalar, ), 'LeakyReLU')
+    def derivative(self, x, y):
+        return F.d_LeakyReLU(x, self.alpha, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_LeakyReLU(out.data, self.alpha) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.LeakyReLU(scalar.data, self.alpha)
+        return Scalar(y, (scalar, ), 'LeakyReLU', self.alpha)
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_LeakyReLU(scalar.data, out._arg, y=out.data) * out.grad
 
 
 class ELU(Activation):
@@ -150,25 +220,101 @@ class ELU(Activation):
     def __repr__(self):
         return f'ELU(α={self.alpha})'
 
-    def __call__(self, scalar):
+    def forward(self, x):
+        return F.ELU(x, self.alpha)
 
-        def _forward():
-            y = F.ELU(scalar.data, self.alpha)
-            return Scalar(y, (scalar, ), 'ELU')
+    def derivative(self, x, y):
+        return F.d_ELU(x, self.alpha, y=y)
 
-        out = _forward()
+    def __call__(self, scalar):
 
-        def _backward():
-            scalar.grad += F.d_ELU(out.data, self.alpha) * out.grad
+        if isinstance(scalar, Tensor):
+            return self._tensor(scalar)
+        if isinstance(scalar, Dual):
+            return self._dual(scalar)
 
-        out._backward = _backward
+        y = F.ELU(scalar.data, self.alpha)
+        return Scalar(y, (scalar, ), 'ELU', self.alpha)
 
-        return out
+    @staticmethod
+    def _backward(out):
+        scalar, = out._prev
+        scalar.grad += F.d_ELU(scalar.data, out._arg, y=out.data) * out.grad
 
 
 def softmax(ins: list):
 
-    exps = [n.exp() for n in ins]
-    sums = sum([n.data for n in exps])
-    outs = [n/sums for n in exps]
+    if isinstance(ins, Tensor):
+        return _softmax_tensor(ins)
+
+    if any(isinstance(n, Dual) for n in ins):
+        return _softmax_dual(ins)
+
+    logits = tuple(n if isinstance(n, Scalar) else Scalar(n) for n in ins)
+
+    # one log-sum-exp node for the whole group of logits, shifted by the
+    # largest one so e ** x never overflows; its _arg keeps the probabilities
+    top = max(n.data for n in logits)
+    exps = [math.exp(n.data - top) for n in logits]
+    sums = sum(exps)
+    probs = tuple(e / sums for e in exps)
+    lse = Scalar(top + math.log(sums), logits, 'logsumexp', probs)
+
+    # Calculation: y_i = e ** (x_i - logsumexp(x))
+    outs = [Scalar(y, (n, lse), 'softmax') for n, y in zip(logits, probs)]
     return outs
+
+
+def _logsumexp_backward(out):
+
+    # Derivative: dlse/dx_j = e ** x_j / Σ e ** x_i = y_j
+    # Chain Rule: dL/dx_j = dL/dlse * y_j
+    for scalar, y in zip(out._prev, out._arg):
+        scalar.grad += out.grad * y
+
+
+def _softmax_backward(out):
+
+    scalar, lse = out._prev
+
+    # Derivative: dy_i/dx_i = y_i, dy_i/dlse = -y_i
+    # Chain Rule: dL/dx_i = dL/dy_i * y_i
+    #             dL/dlse = -Σ dL/dy_i * y_i
+    # with the log-sum-exp node that adds up to the Jacobian-vector product
+    #             dL/dx_j = y_j * (dL/dy_j - Σ dL/dy_i * y_i)
+    scalar.grad += out.grad * out.data
+    lse.grad -= out.grad * out.data
+
+
+BACKWARD['logsumexp'] = _logsumexp_backward
+BACKWARD['softmax'] = _softmax_backward
+
+
+def _softmax_dual(ins):
+
+    xs = [Dual.parts(n) for n in ins]
+    ys = F.softmax([x for x, _ in xs])
+
+    # Tangent: y_i' = y_i * (x_i' - Σ y_j * x_j')
+    dot = sum((y * t for y, (_, t) in zip(ys, xs)), 0.0)
+    return [Dual(y, y * (t - dot)) for y, (_, t) in zip(ys, xs)]
+
+
+def _softmax_tensor(tensor):
+
+    # Calculation: y_i = e ** (x_i - max(x)) / Σ e ** (x_j - max(x))
+    def _forward():
+        y = F.softmax(tensor.data)
+        return Tensor(y, (tensor, ), 'softmax')
+
+    out = _forward()
+
+    # Derivative: dy_i/dx_j = y_i * (δ_ij - y_j)
+    # Chain Rule: dL/dx_j = y_j * (dL/dy_j - Σ dL/dy_i * y_i)
+    def _backward():
+        dot = (out.grad * out.data).sum(axis=-1, keepdims=True)
+        tensor.grad += out.data * (out.grad - dot)
+
+    out._backward = _backward
+
+    return out
@@ -0,0 +1,91 @@
+'''
+Gradient checkpointing for Sequential
+
+A Checkpoint runs one record through the layers without building a graph and
+keeps only each layer's input values. The loss is built on leaf Scalars
+holding the final outputs; once its backward pass has filled their gradients,
+Checkpoint.backward walks the layers in reverse, rebuilds one layer's graph
+at a time from its saved input, and runs backward through that layer alone.
+Only one layer's graph exists at any moment, at the cost of running every
+layer's forward pass twice.
+
+A final softmax layer is split at its logits: they become the leaves and the
+softmax itself is built on them, so a categorical crossentropy loss still
+takes its fused (ŷ - y) path.
+'''
+from kaitorch import activations as A
+from kaitorch.core import Scalar, no_grad
+from kaitorch.layers import Dense, Dropout
+from kaitorch.utils import wrap
+
+__all__ = ['Checkpoint']
+
+
+def _values(x):
+    return [xi.data if isinstance(xi, Scalar) else xi for xi in wrap(x)]
+
+
+def _softmax(layer):
+    return isinstance(layer, Dense) and layer.activation == 'softmax'
+
+
+class Checkpoint:
+
+    def __init__(self, layers, x, train=True):
+
+        self.layers = layers
+        self.train = train
+        self.inputs = []
+
+        # every Dropout layer's keep mask, drawn once and reused when the
+        # layer is recomputed
+        self.masks = {}
+
+        # the last layer stops at its logits when it ends in a softmax
+        self.split = bool(layers) and _softmax(layers[-1])
+
+        with no_grad():
+            for idx, layer in enumerate(layers):
+                x = _values(x)
+                self.inputs.append(x)
+                if isinstance(layer, Dropout):
+                    if train:
+                        self.masks[idx] = layer.mask(len(x)).tolist()
+                        x = Scalar.masked_scale(x, self.masks[idx], 1 - layer.q, layer.rng)
+                elif self.split and idx == len(layers) - 1:
+                    x = [n.__infer__(x) for n in layer.nodes]
+                else:
+                    x = layer.__infer__(x)
+
+        # the leaves the loss is built on, through a softmax when split
+        self.leaves = [Scalar(y) for y in _values(x)]
+        self.outputs = A.softmax(self.leaves) if self.split else self.leaves
+
+    def __repr__(self):
+        return f'Checkpoint(layers={len(self.layers)})'
+
+    def backward(self):
+
+        grads = [y.grad for y in self.leaves]
+
+        for idx in reversed(range(len(self.layers))):
+
+            layer = self.layers[idx]
+            x = [Scalar(xi) for xi in self.inputs[idx]]
+
+            if idx in self.masks:
+                ys = Scalar.masked_scale(x, self.masks[idx], 1 - layer.q, layer.rng)
+            elif isinstance(layer, Dropout):
+                ys = x
+            elif self.split and idx == len(self.layers) - 1:
+                # a softmax Dense node stops at its logit
+                ys = [n(x) for n in layer.nodes]
+            else:
+                ys = layer(x)
+
+            # Σ dL/dy[i] * y[i] has gradient dL/dy[i] at every output y[i],
+            # so one backward pass from it continues the outer one
+            ys = [y if isinstance(y, Scalar) else Scalar(y) for y in wrap(ys)]
+            Scalar.affine(ys, grads, Scalar(0.0)).backward()
+
+            grads = [xi.grad for xi in x]
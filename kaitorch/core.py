@@ -1,6 +1,63 @@
 import math
 
-__all__ = ['Scalar', 'Module']
+import numpy as np
+
+__all__ = ['Scalar', 'Dual', 'Tensor', 'Module', 'build_topo', 'BACKWARD', 'no_grad', 'is_grad_enabled']
+
+# when False, new nodes don't keep references to their parents (see no_grad)
+_grad_enabled = True
+
+
+def build_topo(root):
+    '''
+    Topological order of every node feeding into root (children before parents)
+
+    Iterative depth-first search with an explicit stack, so graph depth is not
+    bounded by Python's recursion limit. Each node is pushed once to be
+    expanded and once more to be emitted after all of its children. Reaching
+    an op's output whose parents were released raises, since the gradients
+    behind it would be silently lost.
+    '''
+    topo = []
+    visited = set()
+    stack = [(root, False)]
+
+    while stack:
+        v, expanded = stack.pop()
+        if expanded:
+            topo.append(v)
+        elif v not in visited:
+            _check_graph(v)
+            visited.add(v)
+            stack.append((v, True))
+            stack.extend((child, False) for child in v._prev if child not in visited)
+
+    return topo
+
+
+class no_grad:
+    '''
+    Context manager that stops ops from recording the graph
+
+        with no_grad():
+            y_pred = model(x, train=False)
+
+    Nodes created inside the block keep no parents, so nothing is retained for
+    a backward pass, and Sequential switches to its plain-float forward.
+    '''
+
+    def __enter__(self):
+        global _grad_enabled
+        self.prev = _grad_enabled
+        _grad_enabled = False
+
+    def __exit__(self, *exc):
+        global _grad_enabled
+        _grad_enabled = self.prev
+
+
+def is_grad_enabled():
+    return _grad_enabled
 
 
 class Module:
@@ -12,40 +69,461 @@ class Module:
     def parameters(self):
         return []
 
+    def __sync__(self, grads=True):
+        # called before an optimizer step (and by zero_grad with grads=False):
+        # a layer keeping a packed copy of its parameters hands the gradients
+        # collected on it to the Scalars, then drops the copy
+        pass
+
 
 class Scalar:
 
-    def __init__(self, data, _in=(), _op=''):
+    # no per-node __dict__: a node is its value, its gradient, a tuple of
+    # parents, an op code and the op's constant argument (e.g. an exponent)
+    __slots__ = ('data', 'grad', '_prev', '_op', '_arg')
+
+    def __init__(self, data, _in=(), _op='', _arg=None):
         self.data = data
         self.grad = 0.0
 
-        self._backward = lambda: None
-        self._prev = set(_in)
+        self._prev = tuple(_in) if _grad_enabled else ()
         self._op = _op
+        self._arg = _arg
 
     def __repr__(self):
         return f'Scalar(data={self.data})'
 
+    def _backward(self):
+        # leaves (no parents) have nothing to propagate to
+        if self._prev:
+            BACKWARD[self._op](self)
+
     def __add__(a, b):
 
+        # a Dual operand is forward mode: Dual.__radd__ handles it
+        if isinstance(b, Dual):
+            return NotImplemented
+
         a = a if isinstance(a, Scalar) else Scalar(a)
         b = b if isinstance(b, Scalar) else Scalar(b)
 
         # Calculation: y = a + b
-        def _forward():
-            _a = a.data
-            _b = b.data
-            _y = _a + _b
-            return Scalar(_y, _in=(a, b), _op='+')
+        return Scalar(a.data + b.data, (a, b), '+')
 
-        y = _forward()
+    @staticmethod
+    def _add_backward(y):
+
+        a, b = y._prev
 
         # Derivative: dy/da = 1
         # Chain Rule: dL/da = dL/dy * dy/da
         #                   = dL/dy
+        a.grad += y.grad
+        b.grad += y.grad
+
+    def __radd__(a, b):
+        # b + a = a + b
+        return a.__add__(b)
+
+    def __mul__(a, b):
+
+        # a Dual operand is forward mode: Dual.__rmul__ handles it
+        if isinstance(b, Dual):
+            return NotImplemented
+
+        a = a if isinstance(a, Scalar) else Scalar(a)
+        b = b if isinstance(b, Scalar) else Scalar(b)
+
+        # Calculation: y = a * b
+        return Scalar(a.data * b.data, (a, b), '*')
+
+    @staticmethod
+    def _mul_backward(y):
+
+        a, b = y._prev
+
+        # Derivative: dy/da = b
+        # Chain Rule: dL/da = dL/dy * dy/da
+        #                   = dL/dy * b
+        a.grad += y.grad * b.data
+        b.grad += y.grad * a.data
+
+    def __rmul__(a, b):
+        # b * a = a * b
+        return a.__mul__(b)
+
+    def __neg__(a):
+        # -a = a * -1
+        return a.__mul__(-1)
+
+    def __sub__(a, b):
+        # a - b = a + (b * -1)
+        return a.__add__(b.__neg__())
+
+    def __rsub__(a, b):
+        # b - a = (a * -1) + b
+        return (a.__neg__()).__add__(b)
+
+    def __pow__(a, b):
+
+        assert isinstance(b, (int, float)), "Exponent is not int/float"
+
+        # Calculation: y = a ** b
+        _y = (a.data + 1e-8) ** b  # don't divide by 0 :)
+        return Scalar(_y, (a,), '**', b)
+
+    @staticmethod
+    def _pow_backward(y):
+
+        a, = y._prev
+        b = y._arg
+
+        # Derivative: dy/da = b * (a ** (b-1))
+        # Chain Rule: dL/da = dL/dy * dy/da
+        #                   = dL/dy * b * (a ** (b-1))
+        a.grad += y.grad * (b * a.data ** (b - 1))
+
+    def __truediv__(a, b):
+        # a / b = a * (b ** -1)
+        return a.__mul__((b + 1e-8).__pow__(-1))
+
+    def __rtruediv__(a, b):
+        # b / a = b * (a ** -1)
+        return b.__mul__((a + 1e-8).__pow__(-1))
+
+    @staticmethod
+    def affine(w, x, b):
+
+        # w are Scalars (weights), x may mix Scalars and plain numbers (inputs)
+        b = b if isinstance(b, Scalar) else Scalar(b)
+        _x = [xi.data if isinstance(xi, Scalar) else xi for xi in x]
+
+        # Calculation: y = Σ w_i * x_i + b
+        _y = sum((wi.data * xi for wi, xi in zip(w, _x)), b.data)
+
+        # one n-ary node instead of a mul and an add node per input
+        _in = (b, *w, *(xi for xi in x if isinstance(xi, Scalar)))
+        return Scalar(_y, _in, 'affine', (w, x))
+
+    @staticmethod
+    def _affine_backward(y):
+
+        b = y._prev[0]
+        w, x = y._arg
+
+        # Derivative: dy/dw_i = x_i, dy/dx_i = w_i, dy/db = 1
+        # Chain Rule: dL/dw_i = dL/dy * x_i
+        #             dL/dx_i = dL/dy * w_i
+        #             dL/db   = dL/dy
+        b.grad += y.grad
+        for wi, xi in zip(w, x):
+            if isinstance(xi, Scalar):
+                wi.grad += y.grad * xi.data
+                xi.grad += y.grad * wi.data
+            else:
+                wi.grad += y.grad * xi
+
+    @staticmethod
+    def masked_scale(xs, mask, p, rng=None):
+
+        # Dropout over a whole layer in one call, one 'dropout' node per input.
+        # The two possible args are shared by every node instead of a tuple each;
+        # they carry the layer's generator (rng) for a jit tape to draw from
+        args = ((p, False, rng), (p, True, rng))
+        scale = 1 / p
+
+        # Calculation: y[i] = x[i] * (1/p) if mask[i] (the unit is kept)
+        #                     0            otherwise
+        return [
+            Scalar(x.data * scale if keep else 0.0, (x, ), 'dropout', args[keep])
+            if isinstance(x, Scalar) else (x * scale if keep else 0.0)
+            for x, keep in zip(xs, mask)
+        ]
+
+    @staticmethod
+    def _dropout_backward(y):
+
+        a, = y._prev
+        p, keep, _ = y._arg
+
+        # Derivative: dy/da = 1/p if kept, 0 if dropped
+        # Chain Rule: dL/da = dL/dy * 1/p
+        if keep:
+            a.grad += y.grad * (1 / p)
+
+    def exp(a):
+
+        # Calculation: y = e ** a
+        return Scalar(math.exp(a.data), (a, ), 'exp')
+
+    @staticmethod
+    def _exp_backward(y):
+
+        a, = y._prev
+
+        # Derivative: dy/da = y
+        # Chain Rule: dL/da = dL/dy * dy/da
+        #                   = dL/dy * y
+        a.grad += y.grad * y.data
+
+    def log(a):
+
+        # Calculation: y = ln(a)
+        return Scalar(math.log(a.data + 1e-8), (a, ), 'ln')
+
+    @staticmethod
+    def _log_backward(y):
+
+        a, = y._prev
+
+        # Derivative: dy/da = 1/a * a'
+        # Chain Rule: dL/da = dL/dy * dy/da * a'
+        #                   = dL/dy * 1/a * a'
+        a.grad += y.grad * ((a.data + 1e-8) ** -1)
+
+    def activation(self, activation):
+
+        import kaitorch.activations as A
+
+        return A.get(activation)(self)
+
+    def backward(self, topo=None, retain_graph=False):
+
+        # Only backward(retain_graph=True) keeps the graph and returns its
+        # topological order, which later passes can take as topo. Without it
+        # every node drops its parents as it goes, nothing is returned and the
+        # graph can't be walked again
+        _check_graph(self)
+
+        # reuse a previously returned order if the graph hasn't changed; the
+        # gradients an earlier pass left on interior nodes (e.g. a subgraph
+        # shared with a retained graph) are cleared, leaves keep accumulating
+        if topo is None:
+            topo = build_topo(self)
+        for node in topo:
+            if node._prev:
+                node.grad = 0.0
+
+        self.grad = 1.0
+
+        if retain_graph:
+            for node in reversed(topo):
+                if node._prev:
+                    BACKWARD[node._op](node)
+            return topo
+
+        # a node's gradient is complete once every node after it in topo has
+        # run, so each node drops its parent links right after its own rule
+        # and, no longer referenced by its children or by topo, is freed
+        topo = list(topo)
+        while topo:
+            node = topo.pop()
+            if node._prev:
+                BACKWARD[node._op](node)
+                node._prev = ()
+                node._arg = None
+
+
+# op code -> static backward rule shared by every node with that op,
+# other modules (e.g. kaitorch.activations) register their own op codes here
+BACKWARD = {
+    '+': Scalar._add_backward,
+    '*': Scalar._mul_backward,
+    '**': Scalar._pow_backward,
+    'affine': Scalar._affine_backward,
+    'dropout': Scalar._dropout_backward,
+    'exp': Scalar._exp_backward,
+    'ln': Scalar._log_backward,
+}
+
+
+class Dual:
+
+    # forward mode: a value and its derivative along one input direction (its
+    # tangent), pushed through every op as it runs - no graph, no backward.
+    # The tangent can also be a NumPy vector, one entry per direction
+    __slots__ = ('data', 'tangent')
+
+    def __init__(self, data, tangent=0.0):
+        self.data = data
+        self.tangent = tangent
+
+    def __repr__(self):
+        return f'Dual(data={self.data}, tangent={self.tangent})'
+
+    @staticmethod
+    def parts(x):
+        # Scalars (e.g. parameters) and plain numbers are constants: tangent 0
+        if isinstance(x, Dual):
+            return x.data, x.tangent
+        if isinstance(x, Scalar):
+            return x.data, 0.0
+        return x, 0.0
+
+    def __add__(a, b):
+
+        b, b_t = Dual.parts(b)
+
+        # Calculation: y = a + b
+        # Tangent:     y' = a' + b'
+        return Dual(a.data + b, a.tangent + b_t)
+
+    def __radd__(a, b):
+        # b + a = a + b
+        return a.__add__(b)
+
+    def __mul__(a, b):
+
+        b, b_t = Dual.parts(b)
+
+        # Calculation: y = a * b
+        # Tangent:     y' = a' * b + a * b'
+        return Dual(a.data * b, a.tangent * b + a.data * b_t)
+
+    def __rmul__(a, b):
+        # b * a = a * b
+        return a.__mul__(b)
+
+    def __neg__(a):
+        # -a = a * -1
+        return a.__mul__(-1)
+
+    def __sub__(a, b):
+
+        b, b_t = Dual.parts(b)
+
+        # Calculation: y = a - b
+        # Tangent:     y' = a' - b'
+        return Dual(a.data - b, a.tangent - b_t)
+
+    def __rsub__(a, b):
+
+        b, b_t = Dual.parts(b)
+
+        # Calculation: y = b - a
+        # Tangent:     y' = b' - a'
+        return Dual(b - a.data, b_t - a.tangent)
+
+    def __pow__(a, b):
+
+        assert isinstance(b, (int, float)), "Exponent is not int/float"
+
+        # Calculation: y = a ** b
+        # Tangent:     y' = b * (a ** (b-1)) * a'
+        _y = (a.data + 1e-8) ** b  # don't divide by 0 :)
+        return Dual(_y, b * a.data ** (b - 1) * a.tangent)
+
+    def __truediv__(a, b):
+        # a / b = a * (b ** -1)
+        # a Scalar divisor goes through the same guarded pow as Scalar does
+        b = Dual(b.data) if isinstance(b, Scalar) else b
+        return a.__mul__((b + 1e-8).__pow__(-1))
+
+    def __rtruediv__(a, b):
+        # b / a = b * (a ** -1)
+        return (a + 1e-8).__pow__(-1).__mul__(b)
+
+    @staticmethod
+    def affine(w, x, b):
+
+        # the weights and bias are constants, only the inputs carry a tangent
+        x = [Dual.parts(xi) for xi in x]
+
+        # Calculation: y = b + Σ w[i] * x[i]
+        # Tangent:     y' = Σ w[i] * x'[i]
+        _y = sum((wi.data * xi for wi, (xi, _) in zip(w, x)), Dual.parts(b)[0])
+        _t = sum((wi.data * xi_t for wi, (_, xi_t) in zip(w, x)), 0.0)
+        return Dual(_y, _t)
+
+    def exp(a):
+
+        # Calculation: y = e ** a
+        # Tangent:     y' = y * a'
+        _y = math.exp(a.data)
+        return Dual(_y, _y * a.tangent)
+
+    def log(a):
+
+        # Calculation: y = ln(a)
+        # Tangent:     y' = 1/a * a'
+        return Dual(math.log(a.data + 1e-8), a.tangent * ((a.data + 1e-8) ** -1))
+
+    def activation(self, activation):
+
+        import kaitorch.activations as A
+
+        return A.get(activation)(self)
+
+
+def has_dual(x):
+    # whether x is a Dual or a list holding one, i.e. runs in forward mode
+    return isinstance(x, Dual) or (isinstance(x, list) and any(isinstance(xi, Dual) for xi in x))
+
+
+def _no_backward():
+    pass
+
+
+def _check_graph(node):
+    # an op's output without parents was released by an earlier backward pass
+    # (or built under no_grad), a pass over it would silently stop there - at
+    # the root or anywhere inside a subgraph shared with an earlier pass
+    if node._op and not node._prev:
+        raise Exception(
+            '[Graph Released] - backward() already ran on this graph (or it was built under no_grad), '
+            'call backward(retain_graph=True) to walk it more than once'
+        )
+
+
+class Tensor:
+
+    # let numpy arrays on the left of an operator defer to Tensor's reflected ops
+    __array_ufunc__ = None
+
+    def __init__(self, data, _in=(), _op=''):
+        self.data = np.asarray(data, dtype=float)
+        self.grad = np.zeros_like(self.data)
+
+        self._backward = lambda: None
+        self._prev = set(_in) if _grad_enabled else set()
+        self._op = _op
+
+    def __repr__(self):
+        return f'Tensor(data={self.data}, shape={self.shape})'
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @staticmethod
+    def _unbroadcast(grad, shape):
+        # sum dL/dy over the axes numpy broadcast so it matches the input shape
+        while grad.ndim > len(shape):
+            grad = grad.sum(axis=0)
+        for axis, size in enumerate(shape):
+            if size == 1 and grad.shape[axis] != 1:
+                grad = grad.sum(axis=axis, keepdims=True)
+        return grad
+
+    def __add__(a, b):
+
+        b = b if isinstance(b, Tensor) else Tensor(b)
+
+        # Calculation: y = a + b
+        def _forward():
+            _y = a.data + b.data
+            return Tensor(_y, _in=(a, b), _op='+')
+
+        y = _forward()
+
+        # Derivative: dy/da = 1
+        # Chain Rule: dL/da = dL/dy
         def _backward():
-            a.grad += y.grad
-            b.grad += y.grad
+            a.grad += Tensor._unbroadcast(y.grad, a.shape)
+            b.grad += Tensor._unbroadcast(y.grad, b.shape)
 
         y._backward = _backward
 
@@ -57,24 +535,20 @@ class Scalar:
 
     def __mul__(a, b):
 
-        a = a if isinstance(a, Scalar) else Scalar(a)
-        b = b if isinstance(b, Scalar) else Scalar(b)
+        b = b if isinstance(b, Tensor) else Tensor(b)
 
         # Calculation: y = a * b
         def _forward():
-            _a = a.data
-            _b = b.data
-            _y = _a * _b
-            return Scalar(_y, _in=(a, b), _op='*')
+            _y = a.data * b.data
+            return Tensor(_y, _in=(a, b), _op='*')
 
         y = _forward()
 
         # Derivative: dy/da = b
-        # Chain Rule: dL/da = dL/dy * dy/da
-        #                   = dL/dy * b
+        # Chain Rule: dL/da = dL/dy * b
         def _backward():
-            a.grad += y.grad * b.data
-            b.grad += y.grad * a.data
+            a.grad += Tensor._unbroadcast(y.grad * b.data, a.shape)
+            b.grad += Tensor._unbroadcast(y.grad * a.data, b.shape)
 
         y._backward = _backward
 
@@ -90,6 +564,7 @@ class Scalar:
 
     def __sub__(a, b):
         # a - b = a + (b * -1)
+        b = b if isinstance(b, Tensor) else Tensor(b)
         return a.__add__(b.__neg__())
 
     def __rsub__(a, b):
@@ -102,15 +577,13 @@ class Scalar:
 
         # Calculation: y = a ** b
         def _forward():
-            _a = a.data
-            _y = (_a + 1e-8) ** b  # don't divide by 0 :)
-            return Scalar(_y, _in=(a,), _op=f'**{b}')
+            _y = (a.data + 1e-8) ** b  # don't divide by 0 :)
+            return Tensor(_y, _in=(a,), _op=f'**{b}')
 
         y = _forward()
 
         # Derivative: dy/da = b * (a ** (b-1))
-        # Chain Rule: dL/da = dL/dy * dy/da
-        #                   = dL/dy * b * (a ** (b-1))
+        # Chain Rule: dL/da = dL/dy * b * (a ** (b-1))
         def _backward():
             a.grad += y.grad * (b * a.data ** (b - 1))
 
@@ -120,25 +593,49 @@ class Scalar:
 
     def __truediv__(a, b):
         # a / b = a * (b ** -1)
+        b = b if isinstance(b, Tensor) else Tensor(b)
         return a.__mul__((b + 1e-8).__pow__(-1))
 
     def __rtruediv__(a, b):
         # b / a = b * (a ** -1)
-        return b.__mul__((a + 1e-8).__pow__(-1))
+        return (a + 1e-8).__pow__(-1).__mul__(b)
+
+    def __matmul__(a, b):
+
+        b = b if isinstance(b, Tensor) else Tensor(b)
+
+        # Calculation: y = a @ b
+        def _forward():
+            _y = a.data @ b.data
+            return Tensor(_y, _in=(a, b), _op='@')
+
+        y = _forward()
+
+        # Derivative: dy/da = bᵀ, dy/db = aᵀ
+        # Chain Rule: dL/da = dL/dy @ bᵀ
+        #             dL/db = aᵀ @ dL/dy
+        def _backward():
+            _a = a.data if a.data.ndim > 1 else a.data[None, :]
+            _b = b.data if b.data.ndim > 1 else b.data[:, None]
+            _g = y.grad.reshape(_a.shape[0], _b.shape[1])
+            a.grad += (_g @ _b.T).reshape(a.shape)
+            b.grad += (_a.T @ _g).reshape(b.shape)
+
+        y._backward = _backward
+
+        return y
 
     def exp(a):
 
         # Calculation: y = e ** a
         def _forward():
-            _a = a.data
-            _y = math.exp(_a)
-            return Scalar(_y, _in=(a, ), _op='exp')
+            _y = np.exp(a.data)
+            return Tensor(_y, _in=(a, ), _op='exp')
 
         y = _forward()
 
         # Derivative: dy/da = y
-        # Chain Rule: dL/da = dL/dy * dy/da
-        #                   = dL/dy * y
+        # Chain Rule: dL/da = dL/dy * y
         def _backward():
             a.grad += y.grad * y.data
 
@@ -150,51 +647,77 @@ class Scalar:
 
         # Calculation: y = ln(a)
         def _forward():
-            _a = a.data
-            _y = math.log(_a + 1e-8)
-            return Scalar(_y, _in=(a, ), _op='ln')
+            _y = np.log(a.data + 1e-8)
+            return Tensor(_y, _in=(a, ), _op='ln')
 
         y = _forward()
 
-        # Derivative: dy/da = 1/a * a'
-        # Chain Rule: dL/da = dL/dy * dy/da * a'
-        #                   = dL/dy * 1/a * a'
+        # Derivative: dy/da = 1/a
+        # Chain Rule: dL/da = dL/dy * 1/a
         def _backward():
-            a.grad += y.grad * ((a.data + 1e-8).__pow__(-1))
+            a.grad += y.grad / (a.data + 1e-8)
 
         y._backward = _backward
 
         return y
 
-    def activation(self, activation):
+    def sum(a, axis=None):
 
-        import kaitorch.activations as A
+        # Calculation: y = Σ a
+        def _forward():
+            _y = a.data.sum(axis=axis)
+            return Tensor(_y, _in=(a, ), _op='sum')
 
-        available = A.__all__
+        y = _forward()
 
-        if isinstance(activation, str) and activation in available:
-            return getattr(A, activation)()(self)
+        # Derivative: dy/da = 1
+        # Chain Rule: dL/da = dL/dy (broadcast back over the summed axis)
+        def _backward():
+            _g = y.grad if axis is None else np.expand_dims(y.grad, axis)
+            a.grad += np.broadcast_to(_g, a.shape)
 
-        elif isinstance(activation, A.Activation):
-            return activation(self)
+        y._backward = _backward
 
-        else:
-            raise Exception(f'Activation {activation} not in {available}')
+        return y
 
-    def backward(self):
+    def mean(a, axis=None):
+        # mean(a) = Σ a / N
+        n = a.data.size if axis is None else a.shape[axis]
+        return a.sum(axis=axis).__mul__(1 / n)
 
-        topo = []
-        visited = set()
+    def activation(self, activation):
 
-        def build_topo(v):
-            if v not in visited:
-                visited.add(v)
-                for child in v._prev:
-                    build_topo(child)
-                topo.append(v)
+        import kaitorch.activations as A
 
-        build_topo(self)
+        return A.get(activation)(self)
 
-        self.grad = 1.0
-        for node in reversed(topo):
+    def backward(self, topo=None, retain_graph=False):
+
+        # like Scalar.backward: only retain_graph=True keeps the graph and
+        # returns the order to reuse
+        _check_graph(self)
+
+        # reuse a previously returned order if the graph hasn't changed,
+        # clearing the gradients left on its interior nodes by earlier passes
+        if topo is None:
+            topo = build_topo(self)
+        for node in topo:
+            if node._prev:
+                node.grad = np.zeros_like(node.data)
+
+        self.grad = np.ones_like(self.data)
+
+        if retain_graph:
+            for node in reversed(topo):
+                node._backward()
+            return topo
+
+        # each _backward closure refers to its own output, dropping it along
+        # with the parent links frees the node without waiting for cycle GC
+        topo = list(topo)
+        while topo:
+            node = topo.pop()
             node._backward()
+            if node._prev:
+                node._prev = set()
+                node._backward = _no_backward
@@ -0,0 +1,142 @@
+'''
+Streaming data sources for Sequential.fit, evaluate and predict
+
+A Dataset pairs inputs x with optional targets y and hands them out one batch
+at a time, so only a batch of records is ever materialized as Python lists.
+Either side can be
+
+    - a list, tuple or NumPy array, indexed a batch at a time
+    - a path to a .npy file, opened memory-mapped so rows are read from disk
+      only when their batch is taken
+    - any other iterable or generator, read in order
+
+Sequences can be shuffled between epochs. Streams are read in the order they
+yield records; a generator can only be read once, so pass an object whose
+__iter__ starts over to train a stream for several epochs.
+'''
+import itertools
+import os
+import random
+
+import numpy as np
+
+from kaitorch.utils import unwrap, wrap
+
+__all__ = ['Dataset']
+
+
+class Dataset:
+
+    def __init__(self, x, y=None):
+
+        self.x = _source(x)
+        self.y = _source(y) if y is not None else None
+        self.indexable = _indexable(self.x) and (self.y is None or _indexable(self.y))
+
+        # the record read off a stream by first(), replayed by the next batches()
+        self._stream = None
+        self._head = None
+
+    def __repr__(self):
+        size = len(self) if self.indexable else 'stream'
+        return f'Dataset({size}, targets={self.y is not None})'
+
+    def __len__(self):
+        if not self.indexable:
+            raise Exception('[Unknown Length] - Streamed data has no length')
+        return len(self.x)
+
+    def size(self):
+        # number of records, None when it is only known by reading the stream
+        return len(self) if self.indexable else None
+
+    def first(self):
+
+        if self.indexable:
+            if not len(self.x):
+                raise Exception('[Empty Data] - Data source holds no records')
+            return _record(self.x[0])
+
+        if self._stream is None:
+            records = iter(self.x)
+            try:
+                self._head = next(records)
+            except StopIteration:
+                raise Exception('[Empty Data] - Data source yielded no records')
+            self._stream = itertools.chain([self._head], records)
+        return _record(self._head)
+
+    def input_size(self):
+        return len(wrap(self.first()))
+
+    def batches(self, batch_size=None, shuffle=False):
+
+        # yields (indices, x_batch, y_batch), indices being each record's
+        # position in the data; y_batch is None without targets
+        if self.indexable:
+            yield from self._index_batches(batch_size, shuffle)
+        else:
+            yield from self._stream_batches(batch_size)
+
+    def _index_batches(self, batch_size, shuffle):
+
+        order = list(range(len(self.x)))
+        if shuffle:
+            random.shuffle(order)
+        batch_size = batch_size or len(order)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            x_batch = _take(self.x, batch)
+            y_batch = _targets(_take(self.y, batch)) if self.y is not None else None
+            yield batch, x_batch, y_batch
+
+    def _stream_batches(self, batch_size):
+
+        xs = self._stream if self._stream is not None else iter(self.x)
+        self._stream = None
+        records = zip(xs, self.y) if self.y is not None else ((x, None) for x in xs)
+
+        start = 0
+        while True:
+            # without a batch size the whole stream is one batch
+            chunk = list(itertools.islice(records, batch_size)) if batch_size else list(records)
+            if not chunk:
+                break
+
+            x_batch = [_record(x) for x, _ in chunk]
+            y_batch = _targets([_record(y) for _, y in chunk]) if self.y is not None else None
+            yield list(range(start, start + len(chunk))), x_batch, y_batch
+            start += len(chunk)
+
+        if start == 0:
+            raise Exception(
+                '[Empty Data] - Data source yielded no records, a generator can only be read once'
+            )
+
+
+def _source(data):
+    if isinstance(data, (str, os.PathLike)) and os.fspath(data).endswith('.npy'):
+        return np.load(data, mmap_mode='r')
+    return wrap(data)
+
+
+def _indexable(data):
+    return isinstance(data, (list, tuple, np.ndarray))
+
+
+def _take(data, batch):
+    if isinstance(data, np.ndarray):
+        # fancy indexing reads only these rows of a memory-mapped file
+        return data[batch].tolist()
+    return [data[i] for i in batch]
+
+
+def _targets(ys):
+    # single-output targets like the rows of an (N, 1) array compare as
+    # numbers, the same way single-output predictions are unwrapped
+    return [unwrap(y) for y in ys]
+
+
+def _record(record):
+    return record.tolist() if isinstance(record, np.ndarray) else record
@@ -1,4 +1,7 @@
 import math
+
+import numpy as np
+
 import kaitorch.activations as A
 
 activations = A.__all__
@@ -6,11 +9,21 @@ derivatives = [f'd_{activation}' for activation in activations]
 
 __all__ = [x for y in zip(activations, derivatives) for x in y]
 
+# Every function takes a float or a NumPy array (elementwise) and returns the
+# same kind. Every derivative takes the input x and, optionally, the output y
+# the forward pass already computed; given y, it never evaluates the function
+# a second time.
+
 
 def sigmoid(x):
     '''
     Calculation: y = 1 / (1 + (e ** -x))
     '''
+    if isinstance(x, np.ndarray):
+        # e ** -|x| never overflows, the sign picks the matching form
+        e = np.exp(-np.abs(x))
+        return np.where(x >= 0, 1 / (1 + e), e / (1 + e))
+
     if x < 0:
         out = math.exp(x) / (1 + math.exp(x))
     else:
@@ -18,13 +31,15 @@ def sigmoid(x):
     return out
 
 
-def d_sigmoid(x):
+def d_sigmoid(x, y=None):
     '''
     Derivative: dy/dx = sigmoid(x) * (1 - sigmoid(x))
+                      = y * (1 - y)
     Chain Rule: dL/dx = dL/dy * dy/dx
-                      = dL/dy * (sigmoid(x) * (1 - sigmoid(x)))
+                      = dL/dy * (y * (1 - y))
     '''
-    out = sigmoid(x) * (1 - sigmoid(x))
+    y = sigmoid(x) if y is None else y
+    out = y * (1 - y)
     return out
 
 
@@ -32,17 +47,22 @@ def tanh(x):
     '''
     Calculation: y = (e ** (2 * x) - 1) / (e ** (2 * x) + 1)
     '''
-    out = (math.exp(2 * x) - 1) / (math.exp(2 * x) + 1)
+    # e ** (2 * x) overflows for x > ~355, the library versions saturate to ±1
+    if isinstance(x, np.ndarray):
+        return np.tanh(x)
+    out = math.tanh(x)
     return out
 
 
-def d_tanh(x):
+def d_tanh(x, y=None):
     '''
     Derivative: dy/dx = (1 - (tanh(x) ** 2))
+                      = 1 - y ** 2
     Chain Rule: dL/dx = dL/dy * dy/dx
-                      = dL/dy * (1 - (tanh(x) ** 2))
+                      = dL/dy * (1 - y ** 2)
     '''
-    out = (1 - (tanh(x) ** 2))
+    y = tanh(x) if y is None else y
+    out = 1 - y ** 2
     return out
 
 
@@ -51,11 +71,13 @@ def ReLU(x):
     Calculation: y = x if x ≥ 0
                      0 if x < 0
     '''
+    if isinstance(x, np.ndarray):
+        return np.maximum(x, 0)
     out = 0 if x < 0 else x
     return out
 
 
-def d_ReLU(x):
+def d_ReLU(x, y=None):
     '''
     Derivative: dy/dx = 1 if x ≥ 0
                         0 if x < 0
@@ -72,11 +94,13 @@ def LeakyReLU(x, alpha=0.1):
     Calculation: y = x if x ≥ 0
                      x * α if x < 0
     '''
+    if isinstance(x, np.ndarray):
+        return np.where(x < 0, x * alpha, x)
     out = x * alpha if x < 0 else x
     return out
 
 
-def d_LeakyReLU(x, alpha=0.1):
+def d_LeakyReLU(x, alpha=0.1, y=None):
     '''
     Derivative: dy/dx = 1 if x ≥ 0
                         α if x < 0
@@ -84,29 +108,37 @@ def d_LeakyReLU(x, alpha=0.1):
                       = dL/dy * 1 if x ≥ 0
                         dL/dy * α if x < 0
     '''
+    if isinstance(x, np.ndarray):
+        return np.where(x < 0, alpha, 1.0)
     out = alpha if x < 0 else 1
     return out
 
 
 def ELU(x, alpha=1.0):
-
     '''
     Calculation: y = x if x ≥ 0
                      α * ((e ** x) - 1) if x < 0
     '''
-    out = alpha * (math.exp(x) - 1) if x < 0 else x
+    # expm1 keeps e ** x - 1 accurate near 0, and e ** x is only taken for x < 0
+    if isinstance(x, np.ndarray):
+        return np.where(x < 0, alpha * np.expm1(np.minimum(x, 0)), x)
+    out = alpha * math.expm1(x) if x < 0 else x
     return out
 
 
-def d_ELU(x, alpha=1.0):
+def d_ELU(x, alpha=1.0, y=None):
     '''
     Derivative: dy/dx = 1 if x ≥ 0
                         α * (e ** x) if x < 0
+                      = y + α        if x < 0
     Chain Rule: dL/dx = dL/dy * dy/dx
                       = dL/dy * 1 if x ≥ 0
-                        dL/dy * α * (e ** x) if x < 0
+                        dL/dy * (y + α) if x < 0
     '''
-    out = (alpha * math.exp(x)) if x < 0 else 1
+    y = ELU(x, alpha) if y is None else y
+    if isinstance(x, np.ndarray):
+        return np.where(x < 0, y + alpha, 1.0)
+    out = (y + alpha) if x < 0 else 1
     return out
 
 
@@ -118,12 +150,48 @@ def swish(x, beta=1.0):
     return out
 
 
-def d_swish(x, beta=1.0):
+def d_swish(x, beta=1.0, y=None):
     '''
-    Derivative: dy/dx = swish(x, β) + sigmoid(β * x) * (1 - swish(x, β))
+    Derivative: dy/dx = β * swish(x, β) + sigmoid(β * x) * (1 - β * swish(x, β))
+                      = β * y + s * (1 - β * y), where s = sigmoid(β * x) = y / x
     Chain Rule: dL/dx = dL/dy * dy/dx
-                      = dL/dy * swish(x, β) + sigmoid(β * x) * (1 - swish(x, β))
+                      = dL/dy * (β * y + s * (1 - β * y))
+    '''
+    if y is None:
+        s = sigmoid(x * beta)
+        y = x * s
+    elif isinstance(x, np.ndarray):
+        # sigmoid(0) = 0.5 where y / x is undefined
+        s = np.divide(y, x, out=np.full_like(y, 0.5, dtype=float), where=x != 0)
+    else:
+        s = y / x if x != 0 else 0.5
+    out = beta * y + s * (1 - beta * y)
+    return out
+
+
+def softmax(xs):
+    '''
+    Calculation: y_i = e ** (x_i - max(x)) / Σ e ** (x_j - max(x))
     '''
+    # arrays are normalized along their last axis
+    if isinstance(xs, np.ndarray):
+        exps = np.exp(xs - xs.max(axis=-1, keepdims=True))
+        return exps / exps.sum(axis=-1, keepdims=True)
+
+    top = max(xs)
+    exps = [math.exp(x - top) for x in xs]
+    total = sum(exps)
+    out = [e / total for e in exps]
+    return out
 
-    out = swish(x, beta) + sigmoid(beta * x) * (1 - swish(x, beta))
+
+def d_softmax(xs, y=None):
+    '''
+    Derivative: dy_i/dx_j = y_i * (1 - y_i) if i = j
+                            -y_i * y_j      if i ≠ j
+                i.e. the Jacobian diag(y) - y yᵀ
+    Chain Rule: dL/dx_j = Σ_i dL/dy_i * dy_i/dx_j
+    '''
+    y = np.asarray(softmax(np.asarray(xs, dtype=float)) if y is None else y, dtype=float)
+    out = y[..., :, None] * (np.eye(y.shape[-1]) - y[..., None, :])
     return out
@@ -41,7 +41,8 @@ def plot_model(root, filename=None):
                  label="{data %.4f | grad %.4f}" % (n.data, n.grad),
                  shape='record')
         if n._op:
-            dot.node(name=uid+n._op, label=n._op)
+            label = f'{n._op}{n._arg}' if n._op == '**' else n._op
+            dot.node(name=uid+n._op, label=label)
             dot.edge(uid+n._op, uid)
 
     for n1, n2 in all_edges:
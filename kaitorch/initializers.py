@@ -1,6 +1,8 @@
 import math
 import random
 
+import numpy as np
+
 __all__ = [
     'glorot_uniform',
     'glorot_normal',
@@ -45,8 +47,19 @@ def random_normal():
     return RandomNormal()
 
 
+def _rng(rng):
+    # a Generator is used as is, anything else (None, an int, a SeedSequence) seeds a new one
+    return rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+
 class Initializer:
-    pass
+
+    def fill(self, shape, nin, nout, rng=None):
+        # one __call__ per entry, for initializers that only define a single
+        # sample; the built-in initializers draw the whole array at once
+        return np.array(
+            [[self(nin, nout) for _ in range(shape[1])] for _ in range(shape[0])], dtype=float
+        )
 
 
 class GlorotUniform(Initializer):
@@ -62,6 +75,15 @@ class GlorotUniform(Initializer):
         )
         return glorot_uniform_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        glorot_uniform_samples = _rng(rng).uniform(
+            low=-math.sqrt(6 / (nin + nout)),
+            high=math.sqrt(6 / (nin + nout)),
+            size=shape
+        )
+        return glorot_uniform_samples
+
     def __repr__(self):
         return 'glorot_uniform'
 
@@ -79,6 +101,15 @@ class GlorotNormal(Initializer):
         )
         return glorot_normal_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        glorot_normal_samples = _rng(rng).normal(
+            loc=0,
+            scale=math.sqrt(2 / (nin + nout)),
+            size=shape
+        )
+        return glorot_normal_samples
+
     def __repr__(self):
         return 'glorot_normal'
 
@@ -96,6 +127,15 @@ class HeUniform(Initializer):
         )
         return he_uniform_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        he_uniform_samples = _rng(rng).uniform(
+            low=-math.sqrt(6 / nin),
+            high=math.sqrt(6 / nin),
+            size=shape
+        )
+        return he_uniform_samples
+
     def __repr__(self):
         return 'he_uniform'
 
@@ -113,6 +153,15 @@ class HeNormal(Initializer):
         )
         return he_normal_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        he_normal_samples = _rng(rng).normal(
+            loc=0,
+            scale=math.sqrt(2 / nin),
+            size=shape
+        )
+        return he_normal_samples
+
     def __repr__(self):
         return 'he_normal'
 
@@ -130,6 +179,15 @@ class LecunUniform(Initializer):
         )
         return lecun_uniform_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        lecun_uniform_samples = _rng(rng).uniform(
+            low=-math.sqrt(3 / nin),
+            high=math.sqrt(3 / nin),
+            size=shape
+        )
+        return lecun_uniform_samples
+
     def __repr__(self):
         return 'lecun_uniform'
 
@@ -147,6 +205,15 @@ class LecunNormal(Initializer):
         )
         return lecun_normal_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        lecun_normal_samples = _rng(rng).normal(
+            loc=0,
+            scale=math.sqrt(1 / nin),
+            size=shape
+        )
+        return lecun_normal_samples
+
     def __repr__(self):
         return 'lecun_normal'
 
@@ -164,6 +231,15 @@ class RandomUniform(Initializer):
         )
         return random_uniform_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        random_uniform_samples = _rng(rng).uniform(
+            low=-0.05,
+            high=0.05,
+            size=shape
+        )
+        return random_uniform_samples
+
     def __repr__(self):
         return 'random_uniform'
 
@@ -181,5 +257,14 @@ class RandomNormal(Initializer):
         )
         return random_normal_sample
 
+    def fill(self, shape, nin, nout, rng=None):
+
+        random_normal_samples = _rng(rng).normal(
+            loc=0,
+            scale=0.05,
+            size=shape
+        )
+        return random_normal_samples
+
     def __repr__(self):
         return 'random_normal'
@@ -0,0 +1,593 @@
+'''
+Trace-once, replay-many training tape
+
+A Tape walks the graph of one record's forward pass and loss a single time and
+flattens it into a linear list of (op, out, ins, arg) instructions over integer
+buffer slots. Replaying the tape runs every instruction on a whole batch at
+once - slot i holds row V[i] with one column per record - so later steps
+allocate no Scalar objects at all.
+
+Tape.optimize rewrites the instructions before they're replayed: constants are
+merged and folded, identical instructions are computed once, the node chains
+behind a - b and a / b become single '-' and '/' instructions, and whatever no
+longer feeds the loss is dropped. Every rewrite keeps the exact floating point
+operations of the chain it replaces, so gradients don't change.
+'''
+from collections import Counter
+
+import numpy as np
+
+from kaitorch import functional as F
+from kaitorch.core import Scalar, build_topo
+
+__all__ = ['Tape']
+
+ACTIVATIONS = ['sigmoid', 'tanh', 'ReLU', 'LeakyReLU', 'ELU', 'swish']
+LOSSES = ['MeanSquaredError', 'BinaryCrossentropy', 'CategoricalCrossentropy']
+
+# elementwise ops that are evaluated once when all their inputs are constants
+FOLDABLE = ['+', '*', '**', 'exp', 'ln'] + ACTIVATIONS
+
+# ops whose inputs can be swapped when looking for identical instructions
+COMMUTATIVE = ['+', '*']
+
+
+class Tape:
+
+    def __init__(self, root, inputs, params, dtype=float, loss_dtype=float):
+
+        # V and G rows are stored as dtype, losses are summed in loss_dtype
+        self.dtype = dtype
+        self.loss_dtype = loss_dtype
+
+        self.n_slots = 0
+        self.slots = {}
+        self.instructions = []
+
+        # leaf slots: model inputs, trainable parameters and constants
+        self.input_slots = [self._new_slot(x) for x in inputs]
+        self.params, self.param_slots = [], []
+        self.const_slots, self.const_values = [], []
+        self.pred_slots = None
+        self.n_targets = 0
+
+        params = set(params)
+        topo = build_topo(root)
+
+        for node in topo:
+            if node in self.slots:
+                continue
+            if node._prev:
+                self._emit(node)
+            elif node in params:
+                self.params.append(node)
+                self.param_slots.append(self._new_slot(node))
+            else:
+                self._constant(node.data, node)
+
+        self.root = self.slots[root]
+        self.const_values = np.array(self.const_values, dtype=float)
+
+    def __repr__(self):
+        return f'Tape(instructions={len(self.instructions)}, slots={self.n_slots})'
+
+    def _new_slot(self, node=None):
+        slot = self.n_slots
+        self.n_slots += 1
+        if node is not None:
+            self.slots[node] = slot
+        return slot
+
+    def _constant(self, value, node=None):
+        slot = self._new_slot(node)
+        self.const_slots.append(slot)
+        self.const_values.append(value)
+        return slot
+
+    def _slot(self, x):
+        # plain numbers (e.g. the raw inputs of an affine node) become constants
+        return self.slots[x] if isinstance(x, Scalar) else self._constant(x)
+
+    def _emit(self, node):
+
+        op, arg = node._op, node._arg
+
+        if op not in KERNELS:
+            raise Exception(f'[Unsupported Op] - Op "{op}" cannot be compiled into a tape')
+
+        if op == 'affine':
+            w, x = arg
+            w = np.array([self._slot(wi) for wi in w], dtype=int)
+            x = np.array([self._slot(xi) for xi in x], dtype=int)
+            ins = (self.slots[node._prev[0]], w, x)
+            arg = (len(set(w.tolist())) == len(w), len(set(x.tolist())) == len(x))
+
+        elif op in LOSSES:
+            # targets are read from the batch, starting at this loss's column
+            ins = np.array([self.slots[p] for p in node._prev], dtype=int)
+            ys = arg[0] if op == 'CategoricalCrossentropy' else arg
+            n_records = arg[1] if op == 'CategoricalCrossentropy' else len(ys)
+            arg = (self.n_targets, len(ys), n_records, len(set(ins.tolist())) == len(ins))
+            self.n_targets += len(ys)
+            self.pred_slots = ins
+
+            if op == 'CategoricalCrossentropy':
+                # softmax predictions are scored from their logit and
+                # log-sum-exp slots, the same way the Scalar loss does
+                fused = np.array([p._op == 'softmax' and bool(p._prev) for p in node._prev])
+                logits, lses = (
+                    np.array([self.slots[p._prev[k]] if f else s for p, f, s in zip(node._prev, fused, ins)],
+                             dtype=int)
+                    for k in (0, 1)
+                )
+                ins = (ins, logits, lses)
+                arg += (fused, )
+
+        elif op == 'logsumexp':
+            # the probabilities in _arg belong to the traced record
+            ins = tuple(self.slots[p] for p in node._prev)
+            arg = None
+
+        else:
+            ins = tuple(self.slots[p] for p in node._prev)
+
+        out = self._new_slot(node)
+        self.instructions.append((op, out, ins, arg))
+
+    def optimize(self):
+
+        consts = dict(zip(self.const_slots, self.const_values.tolist()))
+        self._fold(consts)
+        self._fuse(consts)
+        self._prune()
+        self._compact(consts)
+        return self
+
+    def _fold(self, consts):
+
+        # slot -> the slot now holding its value
+        alias = {}
+
+        def resolve(ins):
+            if isinstance(ins, np.ndarray):
+                return np.array([alias.get(i, i) for i in ins.tolist()], dtype=int)
+            return alias.get(ins, ins)
+
+        # every constant with the same value shares one slot, e.g. the -1 each
+        # a - b wraps into a fresh Scalar
+        by_value = {}
+        for slot, value in consts.items():
+            alias[slot] = by_value.setdefault(_bits(value), slot)
+
+        seen, instructions = {}, []
+        for op, out, ins, arg in self.instructions:
+
+            ins = tuple(resolve(i) for i in ins) if isinstance(ins, tuple) else resolve(ins)
+
+            # a subtree of constants is evaluated now, its output becomes one
+            if op in FOLDABLE and all(i in consts for i in ins):
+                V = np.array([[consts[i]] for i in ins] + [[0.0]])
+                KERNELS[op][0](V, len(ins), tuple(range(len(ins))), arg, {})
+                value = V[-1, 0].item()
+                consts[out] = value
+                alias[out] = by_value.setdefault(_bits(value), out)
+                continue
+
+            # an instruction identical to an earlier one reuses its output;
+            # dropout draws a fresh mask each time, so it never matches
+            if op != 'dropout' and op not in LOSSES:
+                key = (op, _key(sorted(ins) if op in COMMUTATIVE else ins), arg)
+                if key in seen:
+                    alias[out] = seen[key]
+                    continue
+                seen[key] = out
+
+            instructions.append((op, out, ins, arg))
+
+        self.instructions = instructions
+        self.root = alias.get(self.root, self.root)
+        self.pred_slots = None if self.pred_slots is None else resolve(self.pred_slots)
+        self.slots = {node: alias.get(slot, slot) for node, slot in self.slots.items()}
+
+    def _fuse(self, consts):
+
+        uses = self._uses()
+        producers = {out: (op, ins, arg) for op, out, ins, arg in self.instructions}
+        fused = set()
+
+        def single(slot, op, arg=None):
+            # slot is used once, by the instruction being rewritten, and is the
+            # output of op (with arg, when given)
+            if uses[slot] != 1 or slot not in producers:
+                return False
+            return producers[slot][0] == op and (arg is None or producers[slot][2] == arg)
+
+        def negation(slot):
+            # a * -1, from Scalar.__neg__
+            if single(slot, '*'):
+                a, b = producers[slot][1]
+                if consts.get(b) == -1:
+                    return a
+                if consts.get(a) == -1:
+                    return b
+            return None
+
+        def reciprocal(slot):
+            # (a + 1e-8) ** -1, from Scalar.__truediv__
+            if single(slot, '**', -1):
+                t, = producers[slot][1]
+                if single(t, '+'):
+                    a, b = producers[t][1]
+                    if consts.get(b) == 1e-8:
+                        return a, (slot, t)
+            return None, ()
+
+        instructions = []
+        for op, out, ins, arg in self.instructions:
+
+            if op == '+':
+                for a, n in (ins, ins[::-1]):
+                    b = negation(n)
+                    if b is not None:
+                        op, ins = '-', (a, b)
+                        fused.add(n)
+                        break
+
+            elif op == '*':
+                for a, r in (ins, ins[::-1]):
+                    b, chain = reciprocal(r)
+                    if b is not None:
+                        op, ins = '/', (a, b)
+                        fused.update(chain)
+                        break
+
+            instructions.append((op, out, ins, arg))
+
+        self.instructions = [inst for inst in instructions if inst[1] not in fused]
+
+    def _outputs(self):
+        # slots read after the replay: the loss and the predictions
+        return [self.root] + ([] if self.pred_slots is None else self.pred_slots.tolist())
+
+    def _uses(self):
+        uses = Counter(self._outputs())
+        for _, _, ins, _ in self.instructions:
+            for i in ins:
+                uses.update(i.tolist() if isinstance(i, np.ndarray) else [i])
+        return uses
+
+    def _prune(self):
+
+        # drop instructions nothing downstream of them reads; dropout stays so
+        # every later mask is drawn from the same random stream
+        live = set(self._outputs())
+        instructions = []
+        for inst in reversed(self.instructions):
+            op, out, ins, arg = inst
+            if out in live or op == 'dropout':
+                instructions.append(inst)
+                for i in ins:
+                    live.update(i.tolist() if isinstance(i, np.ndarray) else [i])
+        self.instructions = instructions[::-1]
+
+    def _compact(self, consts):
+
+        # renumber the slots still in use, so V and G only hold those rows
+        uses = self._uses()
+        const_slots = sorted(slot for slot in consts if uses[slot])
+
+        new = {}
+        for slot in self.input_slots + self.param_slots + const_slots:
+            new.setdefault(slot, len(new))
+        for _, out, _, _ in self.instructions:
+            new[out] = len(new)
+
+        def renumber(ins):
+            if isinstance(ins, np.ndarray):
+                return np.array([new[i] for i in ins.tolist()], dtype=int)
+            return new[ins]
+
+        instructions = []
+        for op, out, ins, arg in self.instructions:
+            ins = tuple(renumber(i) for i in ins) if isinstance(ins, tuple) else renumber(ins)
+            # repeated indices need np.add.at, and merging can create them
+            if op == 'affine':
+                _, w, x = ins
+                arg = (len(set(w.tolist())) == len(w), len(set(x.tolist())) == len(x))
+            elif op in LOSSES:
+                preds = _preds(op, ins)
+                arg = arg[:3] + (len(set(preds.tolist())) == len(preds),) + arg[4:]
+            instructions.append((op, new[out], ins, arg))
+
+        self.instructions = instructions
+        self.n_slots = len(new)
+        self.input_slots = [new[slot] for slot in self.input_slots]
+        self.param_slots = [new[slot] for slot in self.param_slots]
+        self.const_slots = [new[slot] for slot in const_slots]
+        self.const_values = np.array([consts[slot] for slot in const_slots], dtype=float)
+        self.root = new[self.root]
+        self.pred_slots = None if self.pred_slots is None else renumber(self.pred_slots)
+        self.slots = {node: new[slot] for node, slot in self.slots.items() if slot in new}
+
+    def __call__(self, x, y, train=True, batch_size=None):
+
+        # batch_size > len(x) when x is one shard of a larger batch
+        x = np.asarray(x, dtype=self.dtype).reshape(len(x), -1)
+        n_records = len(x)
+        batch_size = batch_size or n_records
+
+        V = np.empty((self.n_slots, n_records), dtype=self.dtype)
+        V[self.input_slots] = x.T
+        V[self.param_slots] = np.array([p.data for p in self.params], dtype=self.dtype)[:, None]
+        V[self.const_slots] = self.const_values[:, None]
+
+        state = {
+            'targets': np.asarray(y, dtype=self.dtype).reshape(n_records, -1).T,
+            'train': train,
+            'loss_dtype': self.loss_dtype,
+        }
+
+        for op, out, ins, arg in self.instructions:
+            KERNELS[op][0](V, out, ins, arg, state)
+
+        # dL/dL = 1, averaged over the batch like Sequential.run's batch loss
+        G = np.zeros_like(V)
+        G[self.root] = 1 / batch_size
+
+        for op, out, ins, arg in reversed(self.instructions):
+            KERNELS[op][1](V, G, out, ins, arg, state)
+
+        grads = G[self.param_slots].sum(axis=1)
+        for p, grad in zip(self.params, grads.tolist()):
+            p.grad += grad
+
+        # a loss kernel keeps its per-record values in loss_dtype
+        return state.get(self.root, V[self.root]), V[self.pred_slots].T
+
+
+def _bits(value):
+    # constants are merged by value, keeping 0.0 and -0.0 apart
+    return value, np.signbit(value).item()
+
+
+def _key(ins):
+    # a hashable form of an instruction's input slots
+    return tuple(tuple(i.tolist()) if isinstance(i, np.ndarray) else i for i in ins)
+
+
+def _preds(op, ins):
+    # the prediction slots of a loss instruction
+    return ins[0] if op == 'CategoricalCrossentropy' else ins
+
+
+def _accumulate(G, idx, grad, unique):
+    # fancy-index += drops repeated indices, np.add.at doesn't
+    if unique:
+        G[idx] += grad
+    else:
+        np.add.at(G, idx, grad)
+
+
+def _add(V, out, ins, arg, state):
+    a, b = ins
+    V[out] = V[a] + V[b]
+
+
+def _add_backward(V, G, out, ins, arg, state):
+    a, b = ins
+    G[a] += G[out]
+    G[b] += G[out]
+
+
+def _mul(V, out, ins, arg, state):
+    a, b = ins
+    V[out] = V[a] * V[b]
+
+
+def _mul_backward(V, G, out, ins, arg, state):
+    a, b = ins
+    G[a] += G[out] * V[b]
+    G[b] += G[out] * V[a]
+
+
+def _sub(V, out, ins, arg, state):
+    a, b = ins
+    # a + (b * -1)
+    V[out] = V[a] - V[b]
+
+
+def _sub_backward(V, G, out, ins, arg, state):
+    a, b = ins
+    G[a] += G[out]
+    G[b] -= G[out]
+
+
+def _div(V, out, ins, arg, state):
+    a, b = ins
+    # a * ((b + 1e-8) ** -1), where ** adds its own 1e-8
+    V[out] = V[a] * ((V[b] + 1e-8) + 1e-8) ** -1
+
+
+def _div_backward(V, G, out, ins, arg, state):
+    a, b = ins
+    G[a] += G[out] * ((V[b] + 1e-8) + 1e-8) ** -1
+    G[b] += G[out] * V[a] * (-1 * (V[b] + 1e-8) ** -2)
+
+
+def _pow(V, out, ins, arg, state):
+    a, = ins
+    V[out] = (V[a] + 1e-8) ** arg
+
+
+def _pow_backward(V, G, out, ins, arg, state):
+    a, = ins
+    G[a] += G[out] * (arg * V[a] ** (arg - 1))
+
+
+def _exp(V, out, ins, arg, state):
+    a, = ins
+    V[out] = np.exp(V[a])
+
+
+def _exp_backward(V, G, out, ins, arg, state):
+    a, = ins
+    G[a] += G[out] * V[out]
+
+
+def _log(V, out, ins, arg, state):
+    a, = ins
+    V[out] = np.log(V[a] + 1e-8)
+
+
+def _log_backward(V, G, out, ins, arg, state):
+    a, = ins
+    G[a] += G[out] / (V[a] + 1e-8)
+
+
+def _affine(V, out, ins, arg, state):
+    b, w, x = ins
+    V[out] = V[b] + (V[w] * V[x]).sum(axis=0)
+
+
+def _affine_backward(V, G, out, ins, arg, state):
+    b, w, x = ins
+    w_unique, x_unique = arg
+    G[b] += G[out]
+    _accumulate(G, w, G[out] * V[x], w_unique)
+    _accumulate(G, x, G[out] * V[w], x_unique)
+
+
+def _dropout(V, out, ins, arg, state):
+    a, = ins
+    p, _, rng = arg
+    # a fresh mask per replay, one draw per record from the Dropout layer's own
+    # generator, keeping a unit the way Dropout.mask does
+    rng = np.random if rng is None else rng
+    mask = rng.random(V.shape[1]) < p if state['train'] else np.ones(V.shape[1], dtype=bool)
+    state[out] = (mask * (1 / p) if state['train'] else mask).astype(V.dtype)
+    V[out] = V[a] * state[out]
+
+
+def _dropout_backward(V, G, out, ins, arg, state):
+    a, = ins
+    G[a] += G[out] * state[out]
+
+
+def _logsumexp(V, out, ins, arg, state):
+    x = V[list(ins)]
+    top = x.max(axis=0)
+    V[out] = top + np.log(np.exp(x - top).sum(axis=0))
+
+
+def _logsumexp_backward(V, G, out, ins, arg, state):
+    # softmax(x)_j = e ** (x_j - lse), from the forward output
+    np.add.at(G, list(ins), G[out] * np.exp(V[list(ins)] - V[out]))
+
+
+def _softmax(V, out, ins, arg, state):
+    a, lse = ins
+    V[out] = np.exp(V[a] - V[lse])
+
+
+def _softmax_backward(V, G, out, ins, arg, state):
+    a, lse = ins
+    G[a] += G[out] * V[out]
+    G[lse] -= G[out] * V[out]
+
+
+def _targets(arg, state):
+    offset, n_targets, n_records, unique = arg[:4]
+    return state['targets'][offset:offset + n_targets], n_records, unique
+
+
+def _mse(V, out, ins, arg, state):
+    ys, n_records, _ = _targets(arg, state)
+    state[out] = ((ys - V[ins]) ** 2).sum(axis=0, dtype=state['loss_dtype']) / n_records
+    V[out] = state[out]
+
+
+def _mse_backward(V, G, out, ins, arg, state):
+    ys, n_records, unique = _targets(arg, state)
+    _accumulate(G, ins, G[out] * -2 * (ys - V[ins]) / n_records, unique)
+
+
+def _crossentropy(V, out, ins, arg, state):
+    ys, n_records, _ = _targets(arg, state)
+    y_preds = V[ins]
+    with np.errstate(all='ignore'):
+        loss = np.where(ys == 1, -np.log(y_preds + 1e-8), 0.0)
+        loss = np.where(ys == 0, -np.log(1 - y_preds + 1e-8), loss)
+    state[out] = loss.sum(axis=0, dtype=state['loss_dtype']) / n_records
+    V[out] = state[out]
+
+
+def _crossentropy_backward(V, G, out, ins, arg, state):
+    ys, n_records, unique = _targets(arg, state)
+    y_preds = V[ins]
+    with np.errstate(all='ignore'):
+        grad = np.where(ys == 1, -1 / (y_preds + 1e-8), 0.0)
+        grad = np.where(ys == 0, 1 / (1 - y_preds + 1e-8), grad)
+    _accumulate(G, ins, G[out] * grad / n_records, unique)
+
+
+def _categorical_crossentropy(V, out, ins, arg, state):
+    preds, logits, lses = ins
+    ys, n_records, _ = _targets(arg, state)
+    fused = arg[4][:, None]
+    with np.errstate(all='ignore'):
+        # -ln(softmax(x)_j) = logsumexp(x) - x_j where a softmax predicted
+        loss = np.where(fused, V[lses] - V[logits], -np.log(V[preds] + 1e-8))
+        loss = np.where(ys != 0, ys * loss, 0.0)
+    state[out] = loss.sum(axis=0, dtype=state['loss_dtype']) / n_records
+    V[out] = state[out]
+
+
+def _categorical_crossentropy_backward(V, G, out, ins, arg, state):
+    preds, logits, lses = ins
+    ys, n_records, unique = _targets(arg, state)
+    fused = arg[4]
+    grad = G[out] * ys / n_records
+    # softmax predictions go to their logit and log-sum-exp, whose backward
+    # completes (ŷ - y) / N at the logits
+    np.add.at(G, logits[fused], -grad[fused])
+    np.add.at(G, lses[fused], grad[fused])
+    _accumulate(G, preds[~fused], -grad[~fused] / (V[preds[~fused]] + 1e-8), unique)
+
+
+def _activation_kernels(name):
+
+    # the same kaitorch.functional rules the Scalar activations use, on
+    # whole rows at once; backward reuses the forward output in V[out]
+    f = getattr(F, name)
+    d_f = getattr(F, f'd_{name}')
+
+    def forward(V, out, ins, arg, state):
+        a, = ins
+        V[out] = f(V[a]) if arg is None else f(V[a], arg)
+
+    def backward(V, G, out, ins, arg, state):
+        a, = ins
+        d_y = d_f(V[a], y=V[out]) if arg is None else d_f(V[a], arg, y=V[out])
+        G[a] += d_y * G[out]
+
+    return forward, backward
+
+
+# op code -> (forward kernel, backward kernel)
+KERNELS = {
+    '+': (_add, _add_backward),
+    '*': (_mul, _mul_backward),
+    '-': (_sub, _sub_backward),
+    '/': (_div, _div_backward),
+    '**': (_pow, _pow_backward),
+    'exp': (_exp, _exp_backward),
+    'ln': (_log, _log_backward),
+    'affine': (_affine, _affine_backward),
+    'dropout': (_dropout, _dropout_backward),
+    'logsumexp': (_logsumexp, _logsumexp_backward),
+    'softmax': (_softmax, _softmax_backward),
+    'MeanSquaredError': (_mse, _mse_backward),
+    'BinaryCrossentropy': (_crossentropy, _crossentropy_backward),
+    'CategoricalCrossentropy': (_categorical_crossentropy, _categorical_crossentropy_backward),
+}
+KERNELS.update({name: _activation_kernels(name) for name in ACTIVATIONS})
@@ -1,6 +1,10 @@
 import random
+
+import numpy as np
+
 from kaitorch.utils import unwrap, wrap
-from kaitorch.core import Scalar, Module
+from kaitorch.core import Dual, Scalar, Tensor, Module, has_dual
+from kaitorch import functional as F
 from kaitorch.initializers import Initializer
 from kaitorch import activations as A
 from kaitorch import initializers as I
@@ -10,28 +14,36 @@ class Dense(Module):
 
     class Node:
 
-        def __init__(self, nin, nout, activation, initializer):
+        def __init__(self, w, b, activation):
 
-            self.w = [Scalar(initializer(nin, nout)) for _ in range(nin)]
-            self.b = Scalar(initializer(nin, nout))
-            self.a = activation
+            self.w = [Scalar(wi) for wi in w]
+            self.b = Scalar(b)
+            self.a = A.get(activation) if activation not in (None, 'softmax') else None
 
         def __call__(self, x):
             x = wrap(x)
-            signal = sum((wi*xi for wi, xi in zip(self.w, x)), self.b)
-            if self.a and self.a != 'softmax':
-                signal = signal.activation(self.a)
+            signal = Scalar.affine(self.w, x, self.b)
+            if self.a:
+                signal = self.a(signal)
+            return signal
+
+        def __infer__(self, x):
+            signal = sum((wi.data*xi for wi, xi in zip(self.w, x)), self.b.data)
+            if self.a:
+                signal = self.a.forward(signal)
             return signal
 
         def parameters(self):
             return self.w + [self.b]
 
-    def __init__(self, nouts, activation=None, initializer='glorot_uniform'):
+    def __init__(self, nouts, activation=None, initializer='glorot_uniform', seed=None):
         self.nins = None
         self.nouts = nouts
         self.nodes = None
         self.activation = activation
         self.initializer = self.get_initializer(initializer)
+        self.seed = seed
+        self.packed = None
 
     def get_initializer(self, initializer):
 
@@ -57,45 +69,109 @@ class Dense(Module):
             repr_str += f', initializer={self.initializer}'
         return repr_str + ')'
 
+    def get_config(self):
+        # everything Dense(**config) needs to rebuild this layer, activation
+        # objects (e.g. LeakyReLU(alpha=0.1)) as their class and attributes
+        activation = self.activation
+        if isinstance(activation, A.Activation):
+            activation = {'class': type(activation).__name__, 'config': vars(activation)}
+        return {
+            'nouts': self.nouts,
+            'activation': activation,
+            'initializer': repr(self.initializer),
+        }
+
     def __build__(self, nins):
         self.nins = nins
-        self.nodes = [
-            self.Node(self.nins, self.nouts, self.activation, self.initializer)
-            for _ in range(self.nouts)
-        ]
+
+        # the weights (nins rows) and biases (last row) in one draw from the
+        # layer's own stream; unseeded layers take their seed from the global
+        # random module, so random.seed still reproduces a whole model
+        seed = self.seed if self.seed is not None else random.getrandbits(64)
+        values = self.initializer.fill(
+            (self.nins + 1, self.nouts), self.nins, self.nouts, np.random.default_rng(seed)
+        )
+        self.nodes = [self.Node(w, b, self.activation) for *w, b in values.T.tolist()]
+        self.packed = None
 
     def __call__(self, x):
+        if isinstance(x, Tensor):
+            return self._tensor(x)
+        if has_dual(x):
+            return self._dual(x)
         outs = [n(x) for n in self.nodes]
         if self.activation == 'softmax':
             outs = getattr(A, self.activation)(outs)
         return unwrap(outs)
 
-    def parameters(self):
-        return [p for node in self.nodes for p in node.parameters()]
+    def __infer__(self, x):
+        # plain floats in, plain floats out - no graph is built
+        x = [xi.data if isinstance(xi, Scalar) else xi for xi in wrap(x)]
+        outs = [n.__infer__(x) for n in self.nodes]
+        if self.activation == 'softmax':
+            outs = F.softmax(outs)
+        return unwrap(outs)
 
+    def _dual(self, x):
+        # forward mode: values and tangents only, the parameters are constants
+        x = wrap(x)
+        outs = []
+        for n in self.nodes:
+            signal = Dual.affine(n.w, x, n.b)
+            outs.append(n.a(signal) if n.a else signal)
+        if self.activation == 'softmax':
+            outs = A.softmax(outs)
+        return unwrap(outs)
 
-class Dropout(Module):
+    def _tensor(self, x):
+        # one (nin, nout) matmul node per layer instead of one node per weight
+        w, b = self.pack()
+        signal = x @ w + b
+        if self.activation == 'softmax':
+            return A.softmax(signal)
+        if self.activation:
+            signal = signal.activation(self.activation)
+        return signal
 
-    class Node:
+    def pack(self):
 
-        def __init__(self, dropout_rate: float):
-            self.p = 1 - dropout_rate
+        # the weights as one (nin, nout) and the biases as one (nout, ) leaf
+        # Tensor, packed from the Scalars once and shared by every tensor
+        # forward pass until the next optimizer step
+        if self.packed is None:
+            values = np.array([[p.data for p in n.parameters()] for n in self.nodes], dtype=float)
+            self.packed = (Tensor(values[:, :-1].T), Tensor(values[:, -1]))
+        return self.packed
 
-        def __call__(self, x, train):
-            if train:
-                return x * (1/self.p) if random.random() <= self.p else 0
-            else:
-                return x
+    def __sync__(self, grads=True):
 
-        def parameters(self):
-            return []
+        if self.packed is None:
+            return
 
-    def __init__(self, dropout_rate: float = 0.5):
+        # dL/dw of the packed Tensors, one row of nin + 1 per node
+        if grads:
+            w, b = self.packed
+            rows = np.vstack([w.grad, b.grad]).T.tolist()
+            for n, row in zip(self.nodes, rows):
+                for p, grad in zip(n.parameters(), row):
+                    p.grad += grad
+
+        # the step changes the Scalars, the next tensor pass packs them again
+        self.packed = None
+
+    def parameters(self):
+        return [p for node in self.nodes for p in node.parameters()]
+
+
+class Dropout(Module):
+
+    def __init__(self, dropout_rate: float = 0.5, seed=None):
 
         self.nins = None
         self.nouts = None
-        self.nodes = None
         self.q = dropout_rate
+        self.seed = seed
+        self.rng = None
 
         if self.q < 0 or self.q > 1:
             raise ValueError("p must be a probability")
@@ -103,14 +179,43 @@ class Dropout(Module):
     def __repr__(self):
         return f'Dropout(dropout_rate={self.q})'
 
+    def get_config(self):
+        return {'dropout_rate': self.q}
+
     def __build__(self, nins):
         self.nins = nins
         self.nouts = nins
-        self.nodes = [self.Node(self.q) for _ in range(self.nins)]
+
+        # the layer's own stream, seeded like Dense's
+        seed = self.seed if self.seed is not None else random.getrandbits(64)
+        self.rng = np.random.default_rng(seed)
+
+    def mask(self, shape):
+        # keep each unit with probability p = 1 - q, the whole mask in one draw
+        return self.rng.random(shape) < 1 - self.q
 
     def __call__(self, x, train):
-        outs = [n(xi, train) for n, xi in zip(self.nodes, x)]
+        if isinstance(x, Tensor):
+            return self._tensor(x, train)
+        if not train:
+            return x
+        x = wrap(x)
+        outs = Scalar.masked_scale(x, self.mask(len(x)).tolist(), 1 - self.q, self.rng)
         return unwrap(outs)
 
+    def __infer__(self, x, train=False):
+        if not train:
+            return x
+        x = [xi.data if isinstance(xi, Scalar) else xi for xi in wrap(x)]
+        p = 1 - self.q
+        outs = (np.array(x, dtype=float) * (self.mask(len(x)) / p)).tolist()
+        return unwrap(outs)
+
+    def _tensor(self, x, train):
+        if not train:
+            return x
+        p = 1 - self.q
+        return x * (self.mask(x.shape) / p)
+
     def parameters(self):
-        return [p for node in self.nodes for p in node.parameters()]
+        return []
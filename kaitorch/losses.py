@@ -1,9 +1,27 @@
+import math
+
+import numpy as np
+
 from kaitorch.utils import wrap
-from kaitorch.core import Scalar
+from kaitorch.core import BACKWARD, Scalar, Tensor
 
 __all__ = ['mse', 'binary_crossentropy', 'categorical_crossentropy']
 
 
+def _as_scalars(xs):
+    # predictions from the graph-free inference path arrive as plain floats
+    return [x if isinstance(x, Scalar) else Scalar(x) for x in xs]
+
+
+def _as_floats(xs):
+    return tuple(x.data if isinstance(x, Scalar) else x for x in xs)
+
+
+def _from_softmax(y_pred):
+    # a softmax output whose logit and log-sum-exp are still in the graph
+    return y_pred._op == 'softmax' and bool(y_pred._prev)
+
+
 def mse():
     return MeanSquaredError()
 
@@ -16,40 +34,76 @@ def categorical_crossentropy():
     return CategoricalCrossentropy()
 
 
-class MeanSquaredError:
+class Loss:
+
+    # Each loss is a single fused node over all N predictions: the value is
+    # computed in one pass and one static _backward writes every input's
+    # gradient, instead of a handful of Scalar ops per prediction.
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_backward' in vars(cls):
+            BACKWARD[cls.__name__] = cls._backward
+
+
+class MeanSquaredError(Loss):
 
     def __init__(self):
         pass
 
     def __call__(self, ys: list, y_preds: list):
 
-        ys, y_preds = wrap(ys), wrap(y_preds)
+        if isinstance(y_preds, Tensor):
+            return self._tensor(ys, y_preds)
+
+        ys, y_preds = _as_floats(wrap(ys)), _as_scalars(wrap(y_preds))
 
         # for 1/N
         pred_length = len(ys)
 
         # Summation Term
         squared_error = sum(
-            (y - y_pred)**2 for y, y_pred in zip(ys, y_preds))
+            (y - y_pred.data)**2 for y, y_pred in zip(ys, y_preds))
 
         # Mean Squared Error
         mean_squared_error = squared_error/pred_length
 
-        return mean_squared_error
+        return Scalar(mean_squared_error, y_preds, 'MeanSquaredError', ys)
+
+    @staticmethod
+    def _backward(out):
+
+        ys = out._arg
+        pred_length = len(ys)
+
+        # Derivative: dL/dŷ = -2 * (y - ŷ) / N
+        for y, y_pred in zip(ys, out._prev):
+            y_pred.grad += out.grad * -2 * (y - y_pred.data) / pred_length
+
+    def _tensor(self, ys, y_preds):
+
+        ys = np.asarray(ys, dtype=float).reshape(y_preds.shape)
+
+        # Mean Squared Error over the batch axis
+        squared_error = ((y_preds - ys) ** 2).sum()
+        return squared_error / len(y_preds)
 
     def __repr__(self):
         return 'MeanSquaredError()'
 
 
-class BinaryCrossentropy:
+class BinaryCrossentropy(Loss):
 
     def __init__(self):
         pass
 
     def __call__(self, ys, y_preds):
 
+        if isinstance(y_preds, Tensor):
+            return self._tensor(ys, y_preds)
+
         loss = 0.0
-        ys, y_preds = wrap(ys), wrap(y_preds)
+        ys, y_preds = _as_floats(wrap(ys)), _as_scalars(wrap(y_preds))
 
         # for 1/N
         pred_length = len(ys)
@@ -59,28 +113,55 @@ class BinaryCrossentropy:
 
             # Active Left Term
             if y == 1:
-                loss += -(y_pred).log()
+                loss += -math.log(y_pred.data + 1e-8)
 
             # Active Right Term
             elif y == 0:
-                loss += -(1 - y_pred).log()
+                loss += -math.log(1 - y_pred.data + 1e-8)
 
         # Binary Cross Entropy
         binary_crossentropy_loss = loss / pred_length
 
-        return binary_crossentropy_loss
+        return Scalar(binary_crossentropy_loss, y_preds, 'BinaryCrossentropy', ys)
+
+    @staticmethod
+    def _backward(out):
+
+        ys = out._arg
+        pred_length = len(ys)
+
+        for y, y_pred in zip(ys, out._prev):
+
+            # Derivative: dL/dŷ = -1 / ŷ / N
+            if y == 1:
+                y_pred.grad += out.grad * -1 / (y_pred.data + 1e-8) / pred_length
+
+            # Derivative: dL/dŷ = 1 / (1 - ŷ) / N
+            elif y == 0:
+                y_pred.grad += out.grad / (1 - y_pred.data + 1e-8) / pred_length
+
+    def _tensor(self, ys, y_preds):
+
+        ys = np.asarray(ys, dtype=float).reshape(y_preds.shape)
+
+        # Left term where y == 1, right term where y == 0
+        loss = -(ys * y_preds.log() + (1 - ys) * (1 - y_preds).log()).sum()
+        return loss / len(y_preds)
 
     def __repr__(self):
         return 'BinaryCrossentropy()'
 
 
-class CategoricalCrossentropy:
+class CategoricalCrossentropy(Loss):
 
     def __init__(self):
         pass
 
     def __call__(self, ys, y_preds):
 
+        if isinstance(y_preds, Tensor):
+            return self._tensor(ys, y_preds)
+
         loss = 0.0
         if isinstance(ys[0], (int, float, Scalar)):
             ys, y_preds = [ys], [y_preds]
@@ -88,24 +169,93 @@ class CategoricalCrossentropy:
         # 1/N
         pred_length = len(ys)
 
+        # every (record, class) pair flattened into one row of inputs
+        flat_ys, flat_preds = (), []
+
         # Outer summation term
         for y_ohe, y_pred_ohe in zip(ys, y_preds):
 
-            # Inner summation term
+            y_ohe, y_pred_ohe = _as_floats(y_ohe), _as_scalars(y_pred_ohe)
+            flat_ys += y_ohe
+            flat_preds += y_pred_ohe
+
+            # Inner summation term, only the actual class (y_j ≠ 0) contributes
             for y, y_pred in zip(y_ohe, y_pred_ohe):
 
-                # if j is the actual class
-                if y == 1:
-                    loss += -(y_pred).log()
+                if not y:
+                    continue
 
-                # if j is not the actual class
-                elif y == 0:
-                    loss += -(1 - y_pred).log()
+                # -ln(softmax(x)_j) = logsumexp(x) - x_j, which never takes ln(0)
+                if _from_softmax(y_pred):
+                    x, lse = y_pred._prev
+                    loss += y * (lse.data - x.data)
+                else:
+                    loss += y * -math.log(y_pred.data + 1e-8)
 
         # Categorical Cross Entropy
         categorical_crossentropy_loss = loss / pred_length
 
-        return categorical_crossentropy_loss
+        return Scalar(categorical_crossentropy_loss, flat_preds, 'CategoricalCrossentropy',
+                      (flat_ys, pred_length))
+
+    @staticmethod
+    def _backward(out):
+
+        ys, pred_length = out._arg
+
+        for y, y_pred in zip(ys, out._prev):
+
+            if not y:
+                continue
+
+            # a softmax prediction is skipped over, its logit and log-sum-exp
+            # get the gradient of logsumexp(x) - x_j directly:
+            # Derivative: dL/dx_j = -y_j / N, dL/dlse = y_j / N
+            # and the log-sum-exp node's backward completes dL/dx = (ŷ - y) / N
+            if _from_softmax(y_pred):
+                x, lse = y_pred._prev
+                x.grad -= out.grad * y / pred_length
+                lse.grad += out.grad * y / pred_length
+
+            # Derivative: dL/dŷ_j = -y_j / ŷ_j / N
+            else:
+                y_pred.grad += out.grad * -y / (y_pred.data + 1e-8) / pred_length
+
+    def _tensor(self, ys, y_preds):
+
+        ys = np.asarray(ys, dtype=float).reshape(y_preds.shape)
+
+        # 1/N - a single one-hot record counts as a batch of one
+        pred_length = len(y_preds) if y_preds.data.ndim > 1 else 1
+
+        if y_preds._op == 'softmax' and y_preds._prev:
+            return self._softmax_tensor(ys, y_preds, pred_length)
+
+        # only the actual class (y == 1) contributes
+        loss = -(ys * y_preds.log()).sum()
+        return loss / pred_length
+
+    @staticmethod
+    def _softmax_tensor(ys, y_preds, pred_length):
+
+        logits, = y_preds._prev
+
+        # Calculation: L = Σ y_j * (logsumexp(x) - x_j) / N, from the logits
+        def _forward():
+            top = logits.data.max(axis=-1, keepdims=True)
+            lse = top + np.log(np.exp(logits.data - top).sum(axis=-1, keepdims=True))
+            loss = (ys * (lse - logits.data)).sum() / pred_length
+            return Tensor(loss, (logits, ), 'CategoricalCrossentropy')
+
+        out = _forward()
+
+        # Derivative: dL/dx_j = (ŷ_j * Σ y - y_j) / N = (ŷ_j - y_j) / N
+        def _backward():
+            logits.grad += out.grad * (y_preds.data * ys.sum(axis=-1, keepdims=True) - ys) / pred_length
+
+        out._backward = _backward
+
+        return out
 
     def __repr__(self):
         return 'CategoricalCrossEntropy()'
@@ -1,27 +1,89 @@
+import json
+import math
+import os
+import random
+import struct
+
+import numpy as np
+
 import kaitorch
+import kaitorch.layers
+import kaitorch.losses
 
 from kaitorch import activations as A
 from kaitorch import functional as F
 
-from kaitorch.core import Module, Scalar
+from kaitorch.core import Dual, Module, Scalar, Tensor, has_dual, is_grad_enabled, no_grad
+from kaitorch.data import Dataset
 from kaitorch.layers import Dropout
 from kaitorch.graph import plot_model
-from kaitorch.utils import ffill, unwrap, wrap
+from kaitorch.utils import as_data, ffill, unwrap, wrap
 from kaitorch.optimizers import Optimizer
+from kaitorch.jit import Tape
+from kaitorch.checkpoint import Checkpoint
+from kaitorch.parallel import DataParallel, ParallelPredict
+from kaitorch.profiler import Profiler
 
 from tqdm import tqdm
 
+# Sequential.save layout: MAGIC, the header length as a little-endian uint64,
+# a JSON header (architecture, optimizer and loss config) padded so the data
+# starts on a 64 byte boundary, then one contiguous float array of shape
+# (buffers, params) - parameter values first, then each optimizer moment.
+MAGIC = b'KAITORCH'
+FORMAT_VERSION = 1
+
+# precisions a model's jit tape and loss accumulation can run in
+DTYPES = ['float32', 'float64']
+
+
+def _dtype(dtype):
+    try:
+        name = np.dtype(dtype).name
+    except TypeError:
+        name = None
+    if name not in DTYPES:
+        raise Exception(f'[Undefined dtype] - dtype "{dtype}" is not one of {DTYPES}')
+    return name
+
+
+def _batch_mean(losses, batch_size):
+
+    # Calculation: L = Σ loss_i / batch_size
+    # one n-ary affine node with constant weights 1 / batch_size, instead of a
+    # chain of len(losses) '+' nodes and a division
+    return Scalar.affine(losses, [1 / batch_size] * len(losses), Scalar(0.0))
+
 
 class Sequential(Module):
 
-    def __init__(self, layers=None):
+    def __init__(self, layers=None, seed=None, dtype='float64', loss_dtype='float64'):
         self.built = False
+        self.seed = seed
+
+        # dtype is the precision of the jit tape's per-record values and
+        # gradients, the bulk of its memory. Parameters, gradients and optimizer
+        # moments always stay float64: Scalars hold Python floats. Losses are
+        # summed up in loss_dtype
+        self.dtype = _dtype(dtype)
+        self.loss_dtype = _dtype(loss_dtype)
         self.compiled = False
+        self.jit = False
+        self.checkpoint = False
+        self.tape = None
+        self.data_parallel = None
+        self.profiler = None
 
         self.layers = layers if layers else []
         self.layer_sizes = [layer.nouts for layer in self.layers] if self.layers else []
 
     def __call__(self, x, train):
+        if not is_grad_enabled() and not isinstance(x, Tensor) and not has_dual(x):
+            return self.__infer__(x, train)
+        if self.profiler:
+            return unwrap(self.profiler.forward(self.layers, x, lambda layer, x: (
+                layer(x, train) if isinstance(layer, Dropout) else layer(x)
+            )))
         for layer in self.layers:
             if isinstance(layer, Dropout):
                 x = layer(x, train)
@@ -29,6 +91,28 @@ class Sequential(Module):
                 x = layer(x)
         return unwrap(x)
 
+    def __infer__(self, x, train=False):
+        if self.profiler:
+            return unwrap(self.profiler.forward(self.layers, x, lambda layer, x: (
+                layer.__infer__(x, train) if isinstance(layer, Dropout) else layer.__infer__(x)
+            )))
+        for layer in self.layers:
+            if isinstance(layer, Dropout):
+                x = layer.__infer__(x, train)
+            else:
+                x = layer.__infer__(x)
+        return unwrap(x)
+
+    def jvp(self, x, v, train=False):
+
+        # forward-mode directional derivative: the outputs and their derivative
+        # along direction v in input space, from one pass with no graph
+        x = [Dual(xi, vi) for xi, vi in zip(wrap(x), wrap(v))]
+        self.build(len(x))
+        ys = wrap(self.__call__(x, train=train))
+        ys = [Dual(*Dual.parts(y)) for y in ys]
+        return unwrap([y.data for y in ys]), unwrap([y.tangent for y in ys])
+
     def __repr__(self):
         print([layer.parameters() for layer in self.layers])
         return '\n'.join(str(layer) for layer in self.layers)
@@ -72,11 +156,25 @@ class Sequential(Module):
         self.layer_sizes.insert(0, input_size)
         self.layer_sizes = ffill(self.layer_sizes)
 
+        # a seeded model hands each unseeded layer its own child stream
+        if self.seed is not None:
+            streams = np.random.SeedSequence(self.seed).spawn(len(self.layers))
+            for layer, stream in zip(self.layers, streams):
+                if getattr(layer, 'seed', False) is None:
+                    layer.seed = stream
+
         for idx, layer in enumerate(self.layers):
             layer.__build__(self.layer_sizes[idx])
 
         self.built = True
 
+        if self.compiled:
+            self.optimizer.register(self.parameters())
+
+    def profile(self):
+        # use as a context manager: with model.profile() as prof: model.fit(...)
+        return Profiler(self)
+
     def plot(self, filename=None):
 
         if not self.built:
@@ -89,7 +187,122 @@ class Sequential(Module):
     def parameters(self):
         return [p for layer in self.layers for p in layer.parameters()]
 
-    def compile(self, optimizer, loss):
+    def save(self, path):
+
+        if not self.built:
+            raise Exception(
+                '[Model Not Built] - Use Sequential.build(input_size) to build model'
+            )
+
+        params = self.parameters()
+        buffers = [np.array([p.data for p in params], dtype=float)]
+        header = {
+            'format': FORMAT_VERSION,
+            'input_size': self.layer_sizes[0],
+            'layers': [
+                {'class': type(layer).__name__, 'config': layer.get_config()}
+                for layer in self.layers
+            ],
+            'compiled': self.compiled,
+            'buffers': ['data'],
+            'n_params': len(params),
+            'dtype': buffers[0].dtype.str,
+            'model_dtype': self.dtype,
+            'loss_dtype': self.loss_dtype,
+            # where each Dropout layer's mask stream stopped, so training
+            # continues with the masks the original run would have drawn next
+            'seed': self.seed,
+            'rng_states': [
+                layer.rng.bit_generator.state if getattr(layer, 'rng', None) is not None else None
+                for layer in self.layers
+            ],
+        }
+
+        if self.compiled:
+            # the decayed learning rate is saved as is, so training resumes where it stopped
+            config = {k: v for k, v in vars(self.optimizer).items() if isinstance(v, (int, float))}
+            header['optimizer'] = {'class': type(self.optimizer).__name__, 'config': config}
+            header['loss'] = type(self.loss).__name__
+            header['jit'] = self.jit
+            header['checkpoint'] = self.checkpoint
+            header['buffers'] += list(self.optimizer.moments)
+            buffers += [getattr(self.optimizer, moment) for moment in self.optimizer.moments]
+
+        header = json.dumps(header).encode()
+        header += b' ' * (-(len(MAGIC) + 8 + len(header)) % 64)
+
+        # written next to path and swapped in, so a model loaded with mmap from
+        # path keeps reading the old file instead of a truncated one
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            np.stack(buffers).tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception(f'[Invalid Model File] - "{path}" was not written by Sequential.save')
+            header_length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_length))
+
+        offset = len(MAGIC) + 8 + header_length
+        shape = (len(header['buffers']), header['n_params'])
+
+        # copy-on-write pages are only read from disk when first touched and
+        # updates never reach the file
+        if mmap:
+            buffers = np.memmap(path, dtype=header['dtype'], mode='c', offset=offset, shape=shape)
+        else:
+            buffers = np.fromfile(path, dtype=header['dtype'], count=shape[0] * shape[1], offset=offset)
+            buffers = buffers.reshape(shape)
+
+        layers = []
+        for layer in header['layers']:
+            config = dict(layer['config'])
+            if isinstance(config.get('activation'), dict):
+                activation = config['activation']
+                config['activation'] = getattr(A, activation['class'])(**activation['config'])
+            layers.append(getattr(kaitorch.layers, layer['class'])(**config))
+
+        model = cls(
+            layers, seed=header.get('seed'), dtype=header.get('model_dtype', header['dtype']),
+            loss_dtype=header.get('loss_dtype', 'float64')
+        )
+
+        if header['compiled']:
+            optimizer = header['optimizer']
+            model.compile(
+                getattr(kaitorch.optimizers, optimizer['class'])(**optimizer['config']),
+                getattr(kaitorch.losses, header['loss'])(),
+                jit=header['jit'],
+                checkpoint=header.get('checkpoint', False)
+            )
+
+        # unseeded layers take their generator's seed from the global random
+        # stream; loading overwrites the weights, so it leaves that stream untouched
+        state = random.getstate()
+        model.build(header['input_size'])
+        random.setstate(state)
+
+        for layer, rng_state in zip(model.layers, header.get('rng_states', [])):
+            if rng_state is not None:
+                layer.rng.bit_generator.state = rng_state
+
+        for p, data in zip(model.parameters(), buffers[0].tolist()):
+            p.data = data
+
+        if header['compiled']:
+            for name, buffer in zip(header['buffers'], buffers):
+                setattr(model.optimizer, name, buffer)
+
+        return model
+
+    def compile(self, optimizer, loss, jit=False, checkpoint=False):
 
         def set_optimizer(optimizer):
             if isinstance(optimizer, str):
@@ -121,7 +334,11 @@ class Sequential(Module):
             if optimizer and loss:
                 set_optimizer(optimizer)
                 set_loss(loss)
+                self.jit = jit
+                self.checkpoint = checkpoint
                 self.compiled = True
+                if self.built:
+                    self.optimizer.register(self.parameters())
             else:
                 raise Exception(
                     '[Unable to Compile] - Optimizer and Loss Function must be specified'
@@ -132,76 +349,237 @@ class Sequential(Module):
         if not self.compiled:
             raise Exception('[Missing Optimizer] - Model has not been compiled')
 
-        for p in self.parameters():
-            self.optimizer(p)
+        # gradients from batched Tensor passes reach the Scalars first
+        for layer in self.layers:
+            layer.__sync__()
 
-    def run(self, x, y=None, epoch=1, epochs=1, train=False):
+        if self.profiler:
+            return self.profiler.step(self.optimizer.step)
+        self.optimizer.step()
+
+    def zero_grad(self):
+        for layer in self.layers:
+            layer.__sync__(grads=False)
+        # reuse the parameter list registered with the optimizer at compile time
+        if not (self.built and self.compiled):
+            return super().zero_grad()
+        for p in self.optimizer.params:
+            p.grad = 0.0
+
+    def trace(self, x, y):
+
+        # one record's forward pass and loss, recorded over Scalar inputs so
+        # the tape can tell inputs, parameters and constants apart
+        inputs = [Scalar(xi) for xi in wrap(x)]
+
+        # the traced pass draws dropout masks too; rewinding the generators
+        # keeps a model traced after load on the same masks as the original
+        rngs = [layer.rng for layer in self.layers if getattr(layer, 'rng', None) is not None]
+        states = [rng.bit_generator.state for rng in rngs]
+        record_loss = self.loss([y], [self.__call__(inputs, train=True)])
+        for rng, state in zip(rngs, states):
+            rng.bit_generator.state = state
+        return Tape(record_loss, inputs, self.optimizer.params, self.dtype, self.loss_dtype).optimize()
+
+    def forward(self, x, train, checkpoints=None):
+
+        # with checkpointing on, only layer-boundary values are kept and each
+        # record's Checkpoint is collected to recompute its layers in backward
+        if checkpoints is None or not self.checkpoint:
+            return self.__call__(x, train=train)
+        checkpoints.append(Checkpoint(self.layers, x, train))
+        return unwrap(checkpoints[-1].outputs)
+
+    def accumulate_gradients(self, x, y, batch_size=None):
+
+        # forward and backward over records x, adding their share of a batch of
+        # batch_size records to every parameter's gradient
+        batch_size = batch_size or len(x)
+
+        if self.jit:
+            if self.tape is None:
+                self.tape = self.trace(x[0], y[0])
+            record_losses, preds = self.tape(x, y, batch_size=batch_size)
+            return record_losses.tolist(), [unwrap(pred) for pred in preds.tolist()]
+
+        preds, record_losses, checkpoints = [], [], []
+        for x_record, y_record in zip(x, y):
+            preds.append(self.forward(x_record, True, checkpoints))
+            record_losses.append(self.loss([y_record], [preds[-1]]))
+
+        batch_loss = _batch_mean(record_losses, batch_size)
+        batch_loss.backward()
+        for checkpoint in checkpoints:
+            checkpoint.backward()
+
+        return as_data(record_losses), as_data(preds)
+
+    def run(self, x, y=None, epoch=1, epochs=1, train=False, batch_size=None, shuffle=False,
+            return_preds=True):
 
         postfix_type = 'Train' if train is True else ''
 
+        data = x if isinstance(x, Dataset) else Dataset(x, y)
+        n_records = data.size()
+
         tqdm_x = tqdm(
-            x,
+            total=n_records,
             ncols=160,
             desc=f"Epoch {epoch:>3}/{epochs}", 
             postfix='',
             bar_format='{l_bar}{bar:40}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}{postfix}]'
         )
 
-        y_pred = []
+        # streams have no length up front, their predictions grow batch by batch
+        y_pred = [None] * (n_records or 0) if return_preds else None
+        # every record's loss is added to the running total in loss_dtype
+        loss_type = np.dtype(self.loss_dtype).type
+        total_loss, seen = loss_type(0.0), 0
 
-        for x_record in tqdm_x:
-            y_pred.append(self.__call__(x_record, train=train))
-            if y:
-                run_loss = self.loss(y[:len(y_pred)], y_pred)
-                tqdm_x.set_postfix_str(f"{postfix_type} Loss: {run_loss.data:.4f}")
-            else:
-                run_loss = None
-                tqdm_x.set_postfix_str(f"{postfix_type}")
+        # one graph per mini-batch, released once its step has been taken
+        for batch, x_batch, y_batch in data.batches(batch_size, shuffle):
 
-        if train:
-            self.zero_grad()
-            run_loss.backward()
-            self.step()
+            batch_pred = []
+            batch_losses = []
+
+            if train and (self.jit or self.data_parallel):
+                # the whole batch at once, replayed on the tape and/or sharded
+                # across worker processes
+                self.zero_grad()
+                if self.data_parallel:
+                    record_losses, batch_pred = self.data_parallel(x_batch, y_batch)
+                else:
+                    record_losses, batch_pred = self.accumulate_gradients(x_batch, y_batch)
+                self.step()
+
+                total_loss += np.sum(record_losses, dtype=self.loss_dtype)
+                seen += len(batch)
+                tqdm_x.update(len(batch))
+                tqdm_x.set_postfix_str(f"{postfix_type} Loss: {total_loss / seen:.4f}")
+
+            else:
+                checkpoints = [] if train else None
+                for k in range(len(batch)):
+                    batch_pred.append(self.forward(x_batch[k], train, checkpoints))
+                    seen += 1
+                    tqdm_x.update(1)
+                    if y_batch is not None:
+                        # every loss is a mean over records, so each record adds
+                        # its own term once instead of re-scoring the whole prefix
+                        record_loss = self.loss([y_batch[k]], [batch_pred[-1]])
+                        batch_losses.append(record_loss)
+                        total_loss += loss_type(record_loss.data)
+                        tqdm_x.set_postfix_str(f"{postfix_type} Loss: {total_loss / seen:.4f}")
+                    else:
+                        tqdm_x.set_postfix_str(f"{postfix_type}")
+
+                if train:
+                    batch_loss = _batch_mean(batch_losses, len(batch_losses))
+                    self.zero_grad()
+                    batch_loss.backward()
+                    for checkpoint in checkpoints:
+                        checkpoint.backward()
+                    self.step()
+                    batch_pred = as_data(batch_pred)
+
+            if return_preds:
+                y_pred.extend([None] * (batch[-1] + 1 - len(y_pred)))
+                for i, pred in zip(batch, batch_pred):
+                    y_pred[i] = pred
+
+        tqdm_x.close()
+
+        # an empty dataset has no mean loss to report
+        run_loss = float(total_loss / seen) if data.y is not None and seen else None
 
         return y_pred, run_loss
 
-    def fit(self, x, y, epochs=1):
+    def fit(self, x, y, epochs=1, batch_size=None, shuffle=True, workers=None):
 
-        x = wrap(x)
-        self.build(len(x[0]))
+        data = Dataset(x, y)
+        self.build(data.input_size())
 
         history = {'loss': []}
 
-        for epoch in range(1, epochs+1):
+        if workers and workers > 1:
+            self.data_parallel = DataParallel(self, workers)
 
-            y_pred, run_loss = self.run(x, y, epoch, epochs, train=True)
-            history['loss'].append(run_loss.data)
+        try:
+            for epoch in range(1, epochs+1):
+
+                y_pred, run_loss = self.run(data, epoch=epoch, epochs=epochs, train=True,
+                                            batch_size=batch_size, shuffle=shuffle,
+                                            return_preds=False)
+                history['loss'].append(run_loss)
+
+        finally:
+            if self.data_parallel:
+                self.data_parallel.close()
+                self.data_parallel = None
 
         return history
 
-    def evaluate(self, x, y):
+    def evaluate(self, x, y, batch_size=None):
 
-        x = wrap(x)
-        self.build(len(x[0]))
+        data = Dataset(x, y)
+        self.build(data.input_size())
 
         evaluation = {'loss': []}
 
-        y_pred, run_loss = self.run(x, y)
-        evaluation['loss'].append(run_loss.data)
+        with no_grad():
+            y_pred, run_loss = self.run(data, batch_size=batch_size, return_preds=False)
+        evaluation['loss'].append(run_loss)
 
         return evaluation
 
-    def predict(self, x, as_scalar=False):
+    def predict(self, x, as_scalar=False, batch_size=None, workers=None):
 
-        x = wrap(x)
-        self.build(len(x[0]))
-
-        y_pred, run_loss = self.run(x)
+        data = Dataset(x)
+        self.build(data.input_size())
 
         if as_scalar:
+            y_pred, run_loss = self.run(data, batch_size=batch_size)
             return [y for y in y_pred]
-        else:
-            if isinstance(y_pred[0], Scalar):
-                return [y.data for y in y_pred]
-            elif isinstance(y_pred[0][0], Scalar):
-                return [[y.data for y in row] for row in y_pred]
+
+        if workers and workers > 1:
+            return self.predict_parallel(data, batch_size, workers)
+
+        with no_grad():
+            y_pred, run_loss = self.run(data, batch_size=batch_size)
+
+        if isinstance(y_pred[0], Scalar):
+            return [y.data for y in y_pred]
+        elif isinstance(y_pred[0], list) and isinstance(y_pred[0][0], Scalar):
+            return [[y.data for y in row] for row in y_pred]
+        return y_pred
+
+    def predict_parallel(self, x, batch_size=None, workers=2):
+
+        data = x if isinstance(x, Dataset) else Dataset(x)
+        n_records = data.size()
+
+        # a few chunks per worker keeps every process busy until the end
+        if batch_size is None and n_records is not None:
+            batch_size = math.ceil(n_records / (workers * 4))
+        chunks = (x_batch for _, x_batch, _ in data.batches(batch_size or 1024))
+
+        tqdm_x = tqdm(
+            total=n_records,
+            ncols=160,
+            desc=f"Epoch {1:>3}/{1}",
+            postfix='',
+            bar_format='{l_bar}{bar:40}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}{postfix}]'
+        )
+
+        y_pred = []
+        predictor = ParallelPredict(self, workers)
+
+        try:
+            for chunk_pred in predictor(chunks):
+                y_pred.extend(chunk_pred)
+                tqdm_x.update(len(chunk_pred))
+        finally:
+            predictor.close()
+            tqdm_x.close()
+
+        return y_pred
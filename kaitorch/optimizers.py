@@ -1,11 +1,46 @@
-import math
-from kaitorch.core import Scalar
+from abc import ABC, abstractmethod
+
+import numpy as np
 
 __all__ = ['SGD', 'Momentum', 'Nesterov', 'Adagrad', 'RMSprop', 'Adam']
 
 
-class Optimizer:
-    pass
+class Optimizer(ABC):
+
+    # Base class for every optimizer. Parameters are no longer updated one at a
+    # time through optimizer(p): register(params) copies them into flat arrays
+    # once and step() hands them to update(), which each optimizer overrides to
+    # rewrite self.data (and its moments) from self.grad for all of them at once
+
+    # names of the per-parameter state arrays an optimizer keeps, e.g. ('m', 'v')
+    moments = ()
+
+    def register(self, params):
+
+        # contiguous buffers for every parameter's value, gradient and moments,
+        # indexed in the order the parameters are registered
+        self.params = list(params)
+        self.data = np.array([p.data for p in self.params], dtype=float)
+        self.grad = np.zeros_like(self.data)
+        for moment in self.moments:
+            setattr(self, moment, np.zeros_like(self.data))
+
+    def step(self):
+
+        n = len(self.params)
+        self.data[:] = np.fromiter((p.data for p in self.params), dtype=float, count=n)
+        self.grad[:] = np.fromiter((p.grad for p in self.params), dtype=float, count=n)
+
+        # one vectorized update for every parameter at once
+        self.update()
+        self.lr *= self.decay_rate
+
+        for p, data in zip(self.params, self.data.tolist()):
+            p.data = data
+
+    @abstractmethod
+    def update(self):
+        pass
 
 
 # Stochastic Gradient Descent
@@ -15,12 +50,10 @@ class SGD(Optimizer):
         self.lr = lr
         self.decay_rate = decay_rate
 
-    def __call__(self, p: Scalar):
+    def update(self):
 
-        # θ'   = θ      - (α       * ▽f(θ) )
-        p.data = p.data - (self.lr * p.grad)
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         - (α       * ▽f(θ)     )
+        self.data[:] = self.data - (self.lr * self.grad)
 
     def __repr__(self):
         return f'SGD(lr={self.lr})'
@@ -29,23 +62,20 @@ class SGD(Optimizer):
 # Stochastic Gradient Descent with Momentum
 class Momentum(Optimizer):
 
+    moments = ('m',)
+
     def __init__(self, lr=0.01, momentum=0.9, decay_rate=1.0):
         self.lr = lr
         self.momentum = momentum
         self.decay_rate = decay_rate
 
-    def __call__(self, p: Scalar):
-
-        if not hasattr(p, 'm'):
-            p.m = 0.0
+    def update(self):
 
-        # m'= η             * m   + (1 - η            ) * ▽f(θ)
-        p.m = self.momentum * p.m + (1 - self.momentum) * p.grad
+        # m'     = η             * m      + (1 - η            ) * ▽f(θ)
+        self.m[:] = self.momentum * self.m + (1 - self.momentum) * self.grad
 
-        # θ'   = θ      - α       * m'
-        p.data = p.data - self.lr * p.m
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         - α       * m'
+        self.data[:] = self.data - self.lr * self.m
 
     def __repr__(self):
         return f'Momentum(lr={self.lr}, Momentum={self.momentum})'
@@ -54,23 +84,20 @@ class Momentum(Optimizer):
 # Stochastic Gradient Descent with Nesterov Accelerated Gradient
 class Nesterov(Optimizer):
 
+    moments = ('m',)
+
     def __init__(self, lr=0.01, momentum=0.9, decay_rate=1.0):
         self.lr = lr
         self.momentum = momentum
         self.decay_rate = decay_rate
 
-    def __call__(self, p: Scalar):
-
-        if not hasattr(p, 'm'):
-            p.m = 0.0
+    def update(self):
 
-        # m'= (η             * m  ) - (α       * ▽f(θ) )
-        p.m = (self.momentum * p.m) - (self.lr * p.grad)
+        # m'     = (η             * m     ) - (α       * ▽f(θ)     )
+        self.m[:] = (self.momentum * self.m) - (self.lr * self.grad)
 
-        # θ'   = θ      + (η             * m' ) - (α       * ▽f(θ) )
-        p.data = p.data + (self.momentum * p.m) - (self.lr * p.grad)
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         + (η             * m'    ) - (α       * ▽f(θ)     )
+        self.data[:] = self.data + (self.momentum * self.m) - (self.lr * self.grad)
 
     def __repr__(self):
         return f'Nesterov(lr={self.lr}, Momentum={self.momentum})'
@@ -79,23 +106,20 @@ class Nesterov(Optimizer):
 # Adaptive Gradient Algorithm
 class Adagrad(Optimizer):
 
+    moments = ('v',)
+
     def __init__(self, lr=0.01, epsilon=1e-8, decay_rate=1.0):
         self.lr = lr
         self.epsilon = epsilon
         self.decay_rate = decay_rate
 
-    def __call__(self, p: Scalar):
-
-        if not hasattr(p, 'v'):
-            p.v = 0.0
+    def update(self):
 
-        # v'= v   + ▽f(θ)^2
-        p.v = p.v + p.grad ** 2
+        # v'     = v      + ▽f(θ)^2
+        self.v[:] = self.v + self.grad ** 2
 
-        # θ'   = θ      - α       * ▽f(θ)  / (        √ v'   + ε           )
-        p.data = p.data - self.lr * p.grad / (math.sqrt(p.v) + self.epsilon)
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         - α       * ▽f(θ)      / (      √ v'      + ε           )
+        self.data[:] = self.data - self.lr * self.grad / (np.sqrt(self.v) + self.epsilon)
 
     def __repr__(self):
         return f'Adagrad(lr={self.lr})'
@@ -104,24 +128,21 @@ class Adagrad(Optimizer):
 # Root Mean Square Propogation
 class RMSprop(Optimizer):
 
+    moments = ('v',)
+
     def __init__(self, lr=0.001, rho=0.9, epsilon=1e-8, decay_rate=1.0):
         self.lr = lr
         self.rho = rho
         self.epsilon = epsilon
         self.decay_rate = decay_rate
 
-    def __call__(self, p: Scalar):
-
-        if not hasattr(p, 'v'):
-            p.v = 0.0
+    def update(self):
 
-        # v'= ρ        * v   + (1 - ρ       ) * ▽f(θ)^2
-        p.v = self.rho * p.v + (1 - self.rho) * p.grad ** 2
+        # v'     = ρ        * v      + (1 - ρ       ) * ▽f(θ)^2
+        self.v[:] = self.rho * self.v + (1 - self.rho) * self.grad ** 2
 
-        # θ'   = θ      - α       * ▽f(θ)  / (        √ v'   + ε)
-        p.data = p.data - self.lr * p.grad / (math.sqrt(p.v) + self.epsilon)
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         - α       * ▽f(θ)      / (      √ v'      + ε)
+        self.data[:] = self.data - self.lr * self.grad / (np.sqrt(self.v) + self.epsilon)
 
     def __repr__(self):
         return f'RMSprop(lr={self.lr}, rho={self.rho})'
@@ -130,6 +151,8 @@ class RMSprop(Optimizer):
 # Adaptive Moment Estimation
 class Adam(Optimizer):
 
+    moments = ('m', 'v')
+
     def __init__(self, lr=0.001, beta1=0.9, beta2=0.999, epsilon=1e-8, decay_rate=1.0):
         self.lr = lr
         self.beta1 = beta1
@@ -137,33 +160,26 @@ class Adam(Optimizer):
         self.epsilon = epsilon
         self.decay_rate = decay_rate
 
-    def __call__(self, p):
-
-        if not hasattr(p, 'm'):
-            p.m = 0.0
-        if not hasattr(p, 'v'):
-            p.v = 0.0
+    def update(self):
 
         # First and Second Moment Estimation
 
-        # m'= β1         * m   + (1 - β1        ) * ▽f(θ)
-        p.m = self.beta1 * p.m + (1 - self.beta1) * p.grad
-        # v'= β1         * v   + (1 - β2        ) * ▽f(θ)^2
-        p.v = self.beta2 * p.v + (1 - self.beta2) * p.grad ** 2
+        # m'     = β1         * m      + (1 - β1        ) * ▽f(θ)
+        self.m[:] = self.beta1 * self.m + (1 - self.beta1) * self.grad
+        # v'     = β1         * v      + (1 - β2        ) * ▽f(θ)^2
+        self.v[:] = self.beta2 * self.v + (1 - self.beta2) * self.grad ** 2
 
         # Bias Correction
 
-        # m^  = m'  / (1 - β1)
-        m_hat = p.m / (1 - self.beta1)
-        # v^  = v'  / (1 - β2)
-        v_hat = p.v / (1 - self.beta2)
+        # m^  = m'     / (1 - β1)
+        m_hat = self.m / (1 - self.beta1)
+        # v^  = v'     / (1 - β2)
+        v_hat = self.v / (1 - self.beta2)
 
         # Parameter Update
 
-        # θ'   = θ      - α       * m^    / (        √ v^   ) + ε           )
-        p.data = p.data - self.lr * m_hat / (math.sqrt(v_hat) + self.epsilon)
-
-        self.lr *= self.decay_rate
+        # θ'        = θ         - α       * m^    / (      √ v^    ) + ε           )
+        self.data[:] = self.data - self.lr * m_hat / (np.sqrt(v_hat) + self.epsilon)
 
     def __repr__(self):
         return f'Adam(lr={self.lr}, β1={self.beta1}, β2={self.beta2})'
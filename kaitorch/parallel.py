@@ -0,0 +1,172 @@
+'''
+Multiprocess data parallelism for Sequential
+
+Every worker process holds a pickled replica of the model. For each batch the
+current parameters are published through shared memory, each worker runs the
+forward and backward pass on its shard of the batch and writes its gradients
+into its own row of a shared (shards, params) buffer, and the rows are summed
+back into the model's parameters before a single optimizer step.
+
+Prediction needs no shared memory: the weights don't change while scoring, so
+each worker keeps the read-only replica it was started with and chunks of
+records are scored in order.
+'''
+import copy
+import math
+import pickle
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+__all__ = ['DataParallel', 'ParallelPredict']
+
+# worker-process globals, set once by _init_worker
+_replica = None
+_params = None
+_memory = None
+_entropy = None
+
+
+class DataParallel:
+
+    def __init__(self, model, workers):
+
+        if not model.compiled:
+            raise Exception('[Missing Optimizer] - Model has not been compiled')
+
+        self.model = model
+        self.workers = workers
+        self.params = model.optimizer.params
+
+        n_params = len(self.params)
+        self.memory = (
+            SharedMemory(create=True, size=max(n_params, 1) * 8),
+            SharedMemory(create=True, size=max(workers * n_params, 1) * 8),
+        )
+        self.shared_params = np.ndarray((n_params, ), dtype=float, buffer=self.memory[0].buf)
+        self.shared_grads = np.ndarray((workers, n_params), dtype=float, buffer=self.memory[1].buf)
+
+        # every shard's dropout masks come from its own stream, derived from
+        # the model's seed, the batch number and the shard index, so a seeded
+        # model draws the same masks whichever worker runs a shard; nothing is
+        # taken from the shuffle's stream
+        self.entropy = np.random.SeedSequence(model.seed).entropy
+        self.batches = 0
+
+        self.pool = mp.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                _replica_payload(model), self.memory[0].name, self.memory[1].name, n_params, workers, self.entropy
+            )
+        )
+
+    def __repr__(self):
+        return f'DataParallel(workers={self.workers})'
+
+    def __call__(self, x, y):
+
+        self.shared_params[:] = [p.data for p in self.params]
+
+        # contiguous shards, one per worker, all scaled by the full batch size
+        batch_size = len(x)
+        shard_size = math.ceil(batch_size / self.workers)
+        shards = [
+            (k, self.batches, x[start:start + shard_size], y[start:start + shard_size], batch_size)
+            for k, start in enumerate(range(0, batch_size, shard_size))
+        ]
+        self.batches += 1
+
+        results = self.pool.starmap(_run_shard, shards)
+
+        grads = self.shared_grads[:len(shards)].sum(axis=0)
+        for p, grad in zip(self.params, grads.tolist()):
+            p.grad += grad
+
+        record_losses = [loss for losses, _ in results for loss in losses]
+        preds = [pred for _, shard_preds in results for pred in shard_preds]
+        return record_losses, preds
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+
+
+class ParallelPredict:
+
+    def __init__(self, model, workers):
+
+        self.workers = workers
+        self.pool = mp.Pool(workers, initializer=_init_predictor, initargs=(_replica_payload(model), ))
+
+    def __repr__(self):
+        return f'ParallelPredict(workers={self.workers})'
+
+    def __call__(self, chunks):
+        # imap hands back each chunk's predictions in submission order
+        return self.pool.imap(_predict_chunk, chunks)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def _replica_payload(model):
+    # replicas are traced again inside their own process
+    replica = copy.copy(model)
+    replica.tape = None
+    replica.data_parallel = None
+    replica.profiler = None
+    return pickle.dumps(replica)
+
+
+def _init_worker(payload, params_name, grads_name, n_params, n_shards, entropy):
+
+    global _replica, _params, _memory, _entropy
+
+    _replica = pickle.loads(payload)
+    _entropy = entropy
+    _memory = (SharedMemory(name=params_name), SharedMemory(name=grads_name))
+    _params = (
+        np.ndarray((n_params, ), dtype=float, buffer=_memory[0].buf),
+        np.ndarray((n_shards, n_params), dtype=float, buffer=_memory[1].buf),
+    )
+
+
+def _run_shard(k, batch, x, y, batch_size):
+
+    shared_params, shared_grads = _params
+    params = _replica.optimizer.params
+
+    # every replica unpickles the same generator states, so each shard
+    # reseeds the Dropout layers (in place, a traced tape keeps using them)
+    # and the global stream from its own (batch, shard) seed
+    seed = np.random.SeedSequence(_entropy, spawn_key=(batch, k))
+    np.random.seed(seed.generate_state(1)[0])
+    for layer, stream in zip(_replica.layers, seed.spawn(len(_replica.layers))):
+        if getattr(layer, 'rng', None) is not None:
+            layer.rng.bit_generator.state = np.random.PCG64(stream).state
+
+    for p, data in zip(params, shared_params.tolist()):
+        p.data = data
+        p.grad = 0.0
+
+    record_losses, preds = _replica.accumulate_gradients(x, y, batch_size)
+
+    shared_grads[k] = [p.grad for p in params]
+    return record_losses, preds
+
+
+def _init_predictor(payload):
+
+    global _replica
+
+    _replica = pickle.loads(payload)
+
+
+def _predict_chunk(x):
+    return [_replica.__infer__(x_record, train=False) for x_record in x]
@@ -0,0 +1,202 @@
+'''
+Opt-in profiler for Sequential
+
+    with model.profile() as prof:
+        model.fit(x, y, epochs=1)
+    print(prof.report())
+    prof.stats()
+
+While a Profiler is active it counts every graph node created per op code,
+times each layer's forward pass and the share of Scalar.backward spent on the
+nodes each layer created, and times every optimizer step. Nothing is patched
+until the profiler is entered, so a model that isn't being profiled only pays
+for one attribute check per forward pass and per step.
+'''
+import time
+from collections import Counter, defaultdict
+
+from kaitorch.core import BACKWARD, Scalar, Tensor, is_grad_enabled
+
+__all__ = ['Profiler']
+
+# backward time spent on nodes created outside any layer, e.g. by the loss
+OUTSIDE = '(loss / outside layers)'
+# the rest of Scalar.backward: sorting the graph and walking it
+TRAVERSAL = '(graph traversal)'
+
+
+class Profiler:
+
+    def __init__(self, model=None):
+
+        self.model = model
+        self.node_counts = Counter()
+        self.forward_time = defaultdict(float)
+        self.backward_time = defaultdict(float)
+        self.step_times = []
+        self.elapsed = 0.0
+
+        # label of the layer whose forward pass is running, the layer that
+        # created each graph node still waiting for its backward pass, and the
+        # time the backward rules took inside the current Scalar.backward call
+        self.layer = None
+        self.owners = {}
+        self._rule_time = 0.0
+        self._labels = []
+        self._patched = None
+        self._start = None
+
+    def __repr__(self):
+        return f'Profiler(active={self._patched is not None})'
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def labels(self):
+        return [f'{idx}: {layer!r}' for idx, layer in enumerate(self.model.layers)] if self.model else []
+
+    def enable(self):
+
+        if self._patched is not None:
+            return
+
+        self._labels = self.labels()
+        self._patched = (Scalar.__init__, Scalar.backward, Tensor.__init__, dict(BACKWARD))
+        scalar_init, scalar_backward, tensor_init, rules = self._patched
+        counts, owners, profiler = self.node_counts, self.owners, self
+
+        def profiled_scalar_init(node, data, _in=(), _op='', _arg=None):
+            scalar_init(node, data, _in, _op, _arg)
+            # keyed by the node itself (not its id, which Python reuses once a
+            # node is freed); graphs built under no_grad never reach backward
+            if profiler.layer and is_grad_enabled():
+                owners[node] = profiler.layer
+            if _op:
+                counts[_op] += 1
+
+        def profiled_tensor_init(node, data, _in=(), _op=''):
+            tensor_init(node, data, _in, _op)
+            if _op:
+                counts[f'{_op} (Tensor)'] += 1
+
+        def profiled_backward(root, topo=None, retain_graph=False):
+            # the unchanged Scalar.backward; whatever its rules didn't take is
+            # the sort and the walk
+            profiler._rule_time = 0.0
+            start = time.perf_counter()
+            out = scalar_backward(root, topo, retain_graph)
+            profiler.backward_time[TRAVERSAL] += time.perf_counter() - start - profiler._rule_time
+            # a released graph can't be walked again, so its nodes are let go
+            if not retain_graph:
+                owners.clear()
+            return out
+
+        Scalar.__init__ = profiled_scalar_init
+        Scalar.backward = profiled_backward
+        Tensor.__init__ = profiled_tensor_init
+        BACKWARD.update({op: self._timed(rule) for op, rule in rules.items()})
+
+        if self.model is not None:
+            self.model.profiler = self
+        self._start = time.perf_counter()
+
+    def disable(self):
+
+        if self._patched is None:
+            return
+
+        Scalar.__init__, Scalar.backward, Tensor.__init__, rules = self._patched
+        BACKWARD.update(rules)
+        self.owners.clear()
+        self._patched = None
+
+        if self.model is not None:
+            self.model.profiler = None
+        self.elapsed += time.perf_counter() - self._start
+
+    def _timed(self, rule):
+
+        backward_time, profiler = self.backward_time, self
+
+        # the op's own backward rule, timed and charged to the layer that
+        # created the node (nodes from outside any layer have no owner)
+        owners = self.owners
+
+        def timed_rule(node):
+            start = time.perf_counter()
+            rule(node)
+            elapsed = time.perf_counter() - start
+            backward_time[owners.get(node, OUTSIDE)] += elapsed
+            profiler._rule_time += elapsed
+
+        return timed_rule
+
+    def forward(self, layers, x, call):
+
+        # runs call(layer, x) for every layer, timing each one
+        for label, layer in zip(self._labels, layers):
+            self.layer = label
+            start = time.perf_counter()
+            x = call(layer, x)
+            self.forward_time[label] += time.perf_counter() - start
+        self.layer = None
+        return x
+
+    def step(self, step):
+        start = time.perf_counter()
+        step()
+        self.step_times.append(time.perf_counter() - start)
+
+    def stats(self):
+
+        layers = {
+            label: {'forward': self.forward_time[label], 'backward': self.backward_time[label]}
+            for label in self.labels()
+        }
+        for label in (OUTSIDE, TRAVERSAL):
+            if label in self.backward_time:
+                layers[label] = {'forward': 0.0, 'backward': self.backward_time[label]}
+
+        steps = len(self.step_times)
+        total_step = sum(self.step_times)
+
+        return {
+            'elapsed': self.elapsed + (time.perf_counter() - self._start if self._patched else 0.0),
+            'nodes': dict(self.node_counts.most_common()),
+            'layers': dict(sorted(
+                layers.items(), key=lambda item: item[1]['forward'] + item[1]['backward'], reverse=True
+            )),
+            'optimizer': {
+                'steps': steps,
+                'total': total_step,
+                'mean': total_step / steps if steps else 0.0,
+            },
+        }
+
+    def report(self):
+
+        stats = self.stats()
+        lines = [f'Profiled {stats["elapsed"]:.3f}s', '']
+
+        lines.append(f'{"Op":<30}{"Nodes":>14}')
+        lines.append('=' * 44)
+        for op, count in stats['nodes'].items():
+            lines.append(f'{op:<30}{count:>14,}')
+
+        lines.append('')
+        lines.append(f'{"Layer":<73}{"Forward (s)":>14}{"Backward (s)":>14}')
+        lines.append('=' * 101)
+        for label, times in stats['layers'].items():
+            lines.append(f'{label:<73}{times["forward"]:>14.4f}{times["backward"]:>14.4f}')
+
+        optimizer = stats['optimizer']
+        lines.append('')
+        lines.append(
+            f'Optimizer: {optimizer["steps"]} steps, {optimizer["total"]:.4f}s total, '
+            f'{optimizer["mean"] * 1e3:.3f}ms per step'
+        )
+        return '\n'.join(lines)
@@ -1,10 +1,11 @@
-__all__ = ['wrap', 'unwrap', 'ffill', 'as_onehot']
+__all__ = ['wrap', 'unwrap', 'as_data', 'ffill', 'as_onehot']
 
 
 def wrap(x):
-    from kaitorch.core import Scalar
+    from kaitorch.core import Dual, Scalar
 
-    if isinstance(x, (int, float, Scalar)):
+    # a single value (a 1-unit layer's output) becomes a one-element list
+    if isinstance(x, (int, float, Scalar, Dual)):
         x = [x]
     return x
 
@@ -18,6 +19,15 @@ def unwrap(out):
     return out
 
 
+def as_data(out):
+    from kaitorch.core import Scalar
+
+    # drop the graph behind an output, keeping only its values
+    if isinstance(out, list):
+        return [as_data(o) for o in out]
+    return out.data if isinstance(out, Scalar) else out
+
+
 def ffill(x: list):
     for i in range(1, len(x)-1):
         if x[i] is None: